@@ -0,0 +1,165 @@
+#############################################
+# Implicit-Feedback Matrix Factorization (ALS)
+#############################################
+
+# Alternating least squares for implicit feedback (Hu, Koren & Volinsky):
+# every stored rating r is an observed preference with confidence
+# c = 1 + alpha * r. User and item factors are solved in turn, one block of
+# rows at a time. Each block is a batched conjugate-gradient solve, warm
+# started from the previous factors, that only needs sparse x dense
+# products, so no per-row factors x factors system is built.
+# With n_jobs > 1 the blocks of every half-step are sharded over processes.
+# The ratings are shared once through batch_runner's memory-mapped store,
+# and the fixed side's factors are written there each half-step.
+# Serving a user is one dot product of its factors with the item factors.
+
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import scipy.sparse as sp
+from batch_runner import SHARED_DIR, open_shared, share_arrays
+from model_store import load_arrays, save_arrays
+from similarity_index import top_k
+
+ALS_MODEL_KIND = "als-model"
+
+# state of a worker process, filled once by _open_worker
+_worker = {}
+
+
+def _row_blocks(matrix, max_nnz):
+    # consecutive row ranges holding about max_nnz ratings each
+    cuts = np.searchsorted(matrix.indptr, np.arange(max_nnz, matrix.nnz, max_nnz))
+    bounds = np.unique(np.concatenate([[0], cuts, [matrix.shape[0]]]))
+    return [np.arange(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+
+def solve_block(matrix, rows, factors, start, gram, alpha, regularization, cg_steps):
+    # Factors of the given rows of matrix (rows x items) against the fixed
+    # factors, minimizing sum c (p - x.y)^2 + regularization |x|^2
+    sub = matrix[rows]
+    confidence = 1 + alpha * sub.data.astype(np.float64)
+    row_of = np.repeat(np.arange(len(rows)), np.diff(sub.indptr))
+    y = factors[sub.indices]
+    system = gram + regularization * np.eye(gram.shape[0])
+
+    def product(v):
+        # (Y^T C_u Y + regularization I) v for every row u of the block
+        weighted = (confidence - 1) * np.einsum("nf,nf->n", y, v[row_of])
+        return v @ system + sp.csr_matrix((weighted, sub.indices, sub.indptr), shape=sub.shape) @ factors
+
+    x = np.array(start, dtype=np.float64)
+    residual = sp.csr_matrix((confidence, sub.indices, sub.indptr), shape=sub.shape) @ factors - product(x)
+    direction = residual.copy()
+    norm = np.einsum("bf,bf->b", residual, residual)
+    for _ in range(cg_steps):
+        step_product = product(direction)
+        curvature = np.einsum("bf,bf->b", direction, step_product)
+        step = np.divide(norm, curvature, out=np.zeros_like(norm), where=curvature > 0)
+        x += step[:, None] * direction
+        residual -= step[:, None] * step_product
+        new_norm = np.einsum("bf,bf->b", residual, residual)
+        beta = np.divide(new_norm, norm, out=np.zeros_like(norm), where=norm > 0)
+        direction = residual + beta[:, None] * direction
+        norm = new_norm
+    return x
+
+
+def _open_worker(path):
+    _worker["matrices"], _, _ = open_shared(path)
+    _worker["path"] = path
+
+
+def _solve_task(side, rows, step, gram, alpha, regularization, cg_steps):
+    factors = np.load(os.path.join(_worker["path"], f"factors_{step}.npy"), mmap_mode="r")
+    start = np.load(os.path.join(_worker["path"], f"start_{step}.npy"), mmap_mode="r")[rows]
+    return solve_block(_worker["matrices"][side], rows, factors, start, gram, alpha, regularization, cg_steps)
+
+
+class ImplicitALS:
+    def __init__(self, factors=64, regularization=0.01, alpha=40.0, iterations=15, cg_steps=3,
+                 block_nnz=1 << 20, n_jobs=1, random_state=0):
+        self.factors = factors
+        self.regularization = regularization
+        self.alpha = alpha
+        self.iterations = iterations
+        self.cg_steps = cg_steps
+        self.block_nnz = block_nnz
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.user_factors = None
+        self.item_factors = None
+
+    def params(self):
+        return {"factors": self.factors, "regularization": self.regularization, "alpha": self.alpha,
+                "iterations": self.iterations, "cg_steps": self.cg_steps}
+
+    def fit(self, ratings):
+        # ratings: users x items sparse matrix (or RatingsMatrix)
+        user_items = sp.csr_matrix(getattr(ratings, "matrix", ratings), dtype=np.float32)
+        item_users = user_items.T.tocsr()
+        rng = np.random.default_rng(self.random_state)
+        self.user_factors = rng.normal(0, 0.01, (user_items.shape[0], self.factors))
+        self.item_factors = rng.normal(0, 0.01, (user_items.shape[1], self.factors))
+        blocks = {"user_items": _row_blocks(user_items, self.block_nnz),
+                  "item_users": _row_blocks(item_users, self.block_nnz)}
+
+        if self.n_jobs == 1:
+            matrices = {"user_items": user_items, "item_users": item_users}
+            for _ in range(self.iterations):
+                for side, solved, fixed in self._half_steps():
+                    gram = fixed.T @ fixed
+                    for rows in blocks[side]:
+                        solved[rows] = solve_block(matrices[side], rows, fixed, solved[rows], gram,
+                                                   self.alpha, self.regularization, self.cg_steps)
+            return self
+
+        with tempfile.TemporaryDirectory(dir=SHARED_DIR) as tmp_dir:
+            path = os.path.join(tmp_dir, "shared")
+            share_arrays(path, {"user_items": user_items, "item_users": item_users})
+            with ProcessPoolExecutor(max_workers=self.n_jobs or os.cpu_count(),
+                                     initializer=_open_worker, initargs=(path,)) as pool:
+                step = 0
+                for _ in range(self.iterations):
+                    for side, solved, fixed in self._half_steps():
+                        np.save(os.path.join(path, f"factors_{step}.npy"), fixed)
+                        np.save(os.path.join(path, f"start_{step}.npy"), solved)
+                        gram = fixed.T @ fixed
+                        futures = [(rows, pool.submit(_solve_task, side, rows, step, gram, self.alpha,
+                                                      self.regularization, self.cg_steps))
+                                   for rows in blocks[side]]
+                        for rows, future in futures:
+                            solved[rows] = future.result()
+                        os.remove(os.path.join(path, f"factors_{step}.npy"))
+                        os.remove(os.path.join(path, f"start_{step}.npy"))
+                        step += 1
+        return self
+
+    def _half_steps(self):
+        # (side, factors solved, factors held fixed): users, then items
+        yield "user_items", self.user_factors, self.item_factors
+        yield "item_users", self.item_factors, self.user_factors
+
+    def scores(self, user_pos):
+        return self.item_factors @ self.user_factors[user_pos]
+
+    def recommend(self, user_pos, k=10, exclude=None):
+        # (item positions, scores) best first; exclude: item positions to
+        # skip, usually the items the user already rated
+        scores = self.scores(user_pos)
+        items = top_k(scores, k, exclude=exclude)
+        return items, scores[items]
+
+    def save(self, path):
+        # float32 factors are plenty for scoring and halve the served model
+        save_arrays(path, ALS_MODEL_KIND, {"user_factors": self.user_factors.astype(np.float32),
+                                           "item_factors": self.item_factors.astype(np.float32)},
+                    self.params())
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        arrays, meta = load_arrays(path, ALS_MODEL_KIND, mmap=mmap)
+        model = cls(**meta)
+        model.user_factors, model.item_factors = arrays["user_factors"], arrays["item_factors"]
+        return model
@@ -0,0 +1,113 @@
+#############################
+# Approximate Nearest Neighbour Index (IVF)
+#############################
+
+# Cluster-pruned cosine search over TF-IDF vectors, in pure NumPy/SciPy.
+# 1. Spherical k-means splits the normalized vectors into n_clusters cells.
+# 2. Rows are stored grouped by cell, so every cell is one contiguous slice.
+# 3. A query only scores the rows of its n_probe closest cells.
+# n_probe is the recall/latency knob: n_probe = n_clusters is an exact search.
+
+import numpy as np
+import scipy.sparse as sp
+from similarity_index import TopKIndex, prepare_matrix, top_k, top_k_rows
+
+
+class IVFIndex:
+    def __init__(self, n_clusters=256, n_probe=8, n_iter=10, sample_size=50000, random_state=0):
+        self.n_clusters = n_clusters
+        self.n_probe = n_probe
+        self.n_iter = n_iter
+        self.sample_size = sample_size
+        self.random_state = random_state
+
+    def fit(self, matrix, normalized=False):
+        matrix = matrix if normalized else prepare_matrix(matrix)
+        rng = np.random.default_rng(self.random_state)
+        n_items = matrix.shape[0]
+        n_clusters = min(self.n_clusters, n_items)
+
+        sample = matrix
+        if n_items > self.sample_size:
+            sample = matrix[np.sort(rng.choice(n_items, self.sample_size, replace=False))]
+        self.centroids = self._train(sample, n_clusters, rng)
+
+        assign = self._assign(matrix)
+        self.order = np.argsort(assign, kind="stable").astype(np.int32)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=n_clusters))])
+        self.matrix = matrix
+        self._cells = matrix[self.order]
+        return self
+
+    def _train(self, sample, n_clusters, rng):
+        centroids = sample[rng.choice(sample.shape[0], n_clusters, replace=False)].toarray()
+        for _ in range(self.n_iter):
+            assign = np.asarray((sample @ centroids.T).argmax(axis=1)).ravel()
+            members = sp.csr_matrix((np.ones(len(assign), dtype=np.float32),
+                                     (assign, np.arange(len(assign)))),
+                                    shape=(n_clusters, sample.shape[0]))
+            sums = (members @ sample).toarray()
+            norms = np.linalg.norm(sums, axis=1)
+            # empty cells are re-seeded with random rows
+            empty = norms == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(sample.shape[0], empty.sum(), replace=False)].toarray()
+                norms[empty] = np.linalg.norm(sums[empty], axis=1)
+            centroids = (sums / np.maximum(norms, 1e-12)[:, None]).astype(np.float32)
+        return centroids
+
+    def _assign(self, matrix, block_size=8192):
+        assign = np.empty(matrix.shape[0], dtype=np.int64)
+        for start in range(0, matrix.shape[0], block_size):
+            block = matrix[start:start + block_size] @ self.centroids.T
+            assign[start:start + block_size] = np.asarray(block).argmax(axis=1)
+        return assign
+
+    def _search(self, terms, weights, k, n_probe, exclude=None):
+        # terms / weights: non-zero columns and values of a normalized query row
+        n_probe = min(self.n_probe if n_probe is None else n_probe, len(self.centroids))
+        cell_scores = self.centroids[:, terms] @ weights
+        dense = np.zeros(self._cells.shape[1], dtype=np.float64)
+        dense[terms] = weights
+        indptr, indices, data = self._cells.indptr, self._cells.indices, self._cells.data
+
+        candidates, scores = [], []
+        for cell in top_k_rows(cell_scores[np.newaxis, :], n_probe)[0]:
+            start, stop = self.offsets[cell], self.offsets[cell + 1]
+            if start == stop:
+                continue
+            # CSR mat-vec over the cell's contiguous slice without slicing the matrix
+            lo, hi = indptr[start], indptr[stop]
+            running = np.concatenate([[0.0], np.cumsum(data[lo:hi] * dense[indices[lo:hi]])])
+            row_ptr = indptr[start:stop + 1] - lo
+            candidates.append(self.order[start:stop])
+            scores.append(running[row_ptr[1:]] - running[row_ptr[:-1]])
+        if not candidates:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        candidates = np.concatenate(candidates)
+        scores = np.concatenate(scores)
+        excluded = None if exclude is None else np.flatnonzero(candidates == exclude)
+        top = top_k(scores, k, exclude=excluded)
+        return candidates[top], scores[top].astype(np.float32)
+
+    def query(self, item_index, k=10, n_probe=None):
+        # Neighbours of an indexed row, the row itself excluded
+        lo, hi = self.matrix.indptr[item_index], self.matrix.indptr[item_index + 1]
+        return self._search(self.matrix.indices[lo:hi], self.matrix.data[lo:hi], k, n_probe,
+                            exclude=item_index)
+
+    def query_vector(self, vector, k=10, n_probe=None):
+        # Neighbours of an unseen vector, e.g. tfidf.transform([overview])
+        vector = prepare_matrix(vector)
+        return self._search(vector.indices, vector.data, k, n_probe)
+
+    def to_topk_index(self, k=10, n_probe=None):
+        # Approximate TopKIndex for catalogues too large for build_topk_index
+        n_items = self.matrix.shape[0]
+        neighbors = np.full((n_items, k), -1, dtype=np.int32)
+        scores = np.zeros((n_items, k), dtype=np.float32)
+        for item_index in range(n_items):
+            found, found_scores = self.query(item_index, k=k, n_probe=n_probe)
+            neighbors[item_index, :len(found)] = found
+            scores[item_index, :len(found)] = found_scores
+        return TopKIndex(neighbors, scores)
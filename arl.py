@@ -18,11 +18,16 @@ pd.set_option('display.max_columns', None)
 pd.set_option('display.width', 500)
 pd.set_option('display.expand_frame_repr', False)
 from mlxtend.frequent_patterns import apriori, association_rules
+from data_loader import load_online_retail
+from basket_matrix import build_basket_matrix
+from itemset_mining import eclat
 
 # https://archive.ics.uci.edu/ml/datasets/Online+Retail+II
 
-df_ = pd.read_excel("datasets/online_retail_II.xlsx",
-                    sheet_name="Year 2010-2011")
+# The workbook is parsed once and cached as typed, compressed columns
+# (datasets/.cache); later runs load the cache in seconds
+df_ = load_online_retail("datasets/online_retail_II.xlsx",
+                         sheet_name="Year 2010-2011")
 df = df_.copy()
 df.head()
 #   Invoice StockCode                          Description  Quantity         InvoiceDate  Price  Customer ID         Country
@@ -59,27 +64,11 @@ df.isnull().sum()
 df.shape
 # (541910, 8)
 
-def outlier_thresholds(dataframe, variable):
-    quartile1 = dataframe[variable].quantile(0.01)
-    quartile3 = dataframe[variable].quantile(0.99)
-    interquantile_range = quartile3 - quartile1
-    up_limit = quartile3 + 1.5 * interquantile_range
-    low_limit = quartile1 - 1.5 * interquantile_range
-    return low_limit, up_limit
-
-def replace_with_thresholds(dataframe, variable):
-    low_limit, up_limit = outlier_thresholds(dataframe, variable)
-    dataframe.loc[(dataframe[variable] < low_limit), variable] = low_limit
-    dataframe.loc[(dataframe[variable] > up_limit), variable] = up_limit
-
-def retail_data_prep(dataframe):
-    dataframe.dropna(inplace=True)
-    dataframe = dataframe[~dataframe["Invoice"].str.contains("C", na=False)]
-    dataframe = dataframe[dataframe["Quantity"] > 0]
-    dataframe = dataframe[dataframe["Price"] > 0]
-    replace_with_thresholds(dataframe, "Quantity")
-    replace_with_thresholds(dataframe, "Price")
-    return dataframe
+# retail_data_prep drops missing values, cancelled invoices (Invoice with
+# "C") and rows with Quantity or Price <= 0 through one combined mask, then
+# caps Quantity and Price at the 1% / 99% quantiles +- 1.5 x IQR with np.clip
+# (both quantiles computed in one call) and shrinks dtypes
+from retail_prep import retail_data_prep
 
 df = retail_data_prep(df)
 df.isnull().sum()
@@ -146,27 +135,23 @@ df_fr.groupby(['Invoice', 'Description']).agg({"Quantity": "sum"}).unstack().fil
 # 537065                                 0.0                0.0                          0.0                      0.0                              0.0
 # 537463                                 0.0                0.0                          0.0                      0.0                              0.0
 
-df_fr.groupby(['Invoice', 'StockCode']). \
-    agg({"Quantity": "sum"}). \
-    unstack(). \
-    fillna(0). \
-    applymap(lambda x: 1 if x > 0 else 0).iloc[0:5, 0:5]
-#           Quantity
-# StockCode    10002 10120 10125 10135 11001
+# groupby().unstack().fillna(0).applymap(lambda x: 1 if x > 0 else 0) builds a
+# dense float frame and calls a Python function on every cell. Instead the
+# invoice and product codes are factorized into a sparse boolean matrix
+basket = build_basket_matrix(df_fr, id=True)
+basket.to_dataframe().iloc[0:5, 0:5]
+# StockCode  10002  10120  10125  10135  11001
 # Invoice
-# 536370           1     0     0     0     0
-# 536852           0     0     0     0     0
-# 536974           0     0     0     0     0
-# 537065           0     0     0     0     0
-# 537463           0     0     0     0     0
+# 536370      True  False  False  False  False
+# 536852     False  False  False  False  False
+# 536974     False  False  False  False  False
+# 537065     False  False  False  False  False
+# 537463     False  False  False  False  False
 
 def create_invoice_product_df(dataframe, id=False):
-    if id:
-        return dataframe.groupby(['Invoice', "StockCode"])['Quantity'].sum().unstack().fillna(0). \
-            applymap(lambda x: 1 if x > 0 else 0)
-    else:
-        return dataframe.groupby(['Invoice', 'Description'])['Quantity'].sum().unstack().fillna(0). \
-            applymap(lambda x: 1 if x > 0 else 0)
+    # Invoice and product are factorized into a sparse boolean basket matrix;
+    # apriori below takes its dense True/False frame
+    return build_basket_matrix(dataframe, id).to_dataframe()
 
 fr_inv_pro_df = create_invoice_product_df(df_fr)
 
@@ -204,6 +189,11 @@ frequent_itemsets.sort_values("support", ascending=False)
 # 40654  0.010283  (22659, 23206, 22726, 22727, 22728, 20750, 223...
 # [40655 rows x 2 columns]
 
+# The same itemsets and supports, mined with Eclat over bitset tidlists of
+# the sparse basket matrix instead of apriori's candidate generation
+# (python benchmark_itemsets.py compares both)
+frequent_itemsets = eclat(build_basket_matrix(df_fr, id=True), min_support=0.01, use_colnames=True)
+
 rules = association_rules(frequent_itemsets,
                           metric="support",
                           min_threshold=0.01)
@@ -246,36 +236,13 @@ sort_values("confidence", ascending=False)
 # 4. Preparing the Script of the Study
 ############################################
 
-def outlier_thresholds(dataframe, variable):
-    quartile1 = dataframe[variable].quantile(0.01)
-    quartile3 = dataframe[variable].quantile(0.99)
-    interquantile_range = quartile3 - quartile1
-    up_limit = quartile3 + 1.5 * interquantile_range
-    low_limit = quartile1 - 1.5 * interquantile_range
-    return low_limit, up_limit
-
-def replace_with_thresholds(dataframe, variable):
-    low_limit, up_limit = outlier_thresholds(dataframe, variable)
-    dataframe.loc[(dataframe[variable] < low_limit), variable] = low_limit
-    dataframe.loc[(dataframe[variable] > up_limit), variable] = up_limit
-
-def retail_data_prep(dataframe):
-    dataframe.dropna(inplace=True)
-    dataframe = dataframe[~dataframe["Invoice"].str.contains("C", na=False)]
-    dataframe = dataframe[dataframe["Quantity"] > 0]
-    dataframe = dataframe[dataframe["Price"] > 0]
-    replace_with_thresholds(dataframe, "Quantity")
-    replace_with_thresholds(dataframe, "Price")
-    return dataframe
+from retail_prep import retail_data_prep
 
 
 def create_invoice_product_df(dataframe, id=False):
-    if id:
-        return dataframe.groupby(['Invoice', "StockCode"])['Quantity'].sum().unstack().fillna(0). \
-            applymap(lambda x: 1 if x > 0 else 0)
-    else:
-        return dataframe.groupby(['Invoice', 'Description'])['Quantity'].sum().unstack().fillna(0). \
-            applymap(lambda x: 1 if x > 0 else 0)
+    # Dense True/False invoice-product frame; create_rules mines the sparse
+    # basket matrix directly and does not need it
+    return build_basket_matrix(dataframe, id).to_dataframe()
 
 
 def check_id(dataframe, stock_code):
@@ -285,15 +252,22 @@ def check_id(dataframe, stock_code):
 
 def create_rules(dataframe, id=True, country="France"):
     dataframe = dataframe[dataframe['Country'] == country]
-    dataframe = create_invoice_product_df(dataframe, id)
-    frequent_itemsets = apriori(dataframe, min_support=0.01, use_colnames=True)
+    # Eclat on the sparse basket matrix: the same itemsets and supports as
+    # apriori on the dense invoice-product frame
+    basket = build_basket_matrix(dataframe, id)
+    frequent_itemsets = eclat(basket, min_support=0.01, use_colnames=True)
     rules = association_rules(frequent_itemsets, metric="support", min_threshold=0.01)
     return rules
 
 df = df_.copy()
 
 df = retail_data_prep(df)
-rules = create_rules(df)
+
+# python rule_store.py mines the rules of every country in parallel into an
+# on-disk store keyed by country and parameters; serving processes load the
+# prebuilt rules instead of re-mining them at startup
+from rule_store import RuleStore
+rules = RuleStore().load_or_mine(df, "France")
 
 rules[(rules["support"]>0.05) & (rules["confidence"]>0.1) & (rules["lift"]>5)]. \
 sort_values("confidence", ascending=False)
@@ -336,25 +310,39 @@ recommendation_list[0:3]
 check_id(df, 22326)
 # ['ROUND SNACK BOXES SET OF4 WOODLAND ']
 
-def arl_recommender(rules_df, product_id, rec_count=1):
-    sorted_rules = rules_df.sort_values("lift", ascending=False)
-    recommendation_list = []
-    for i, product in enumerate(sorted_rules["antecedents"]):
-        for j in list(product):
-            if j == product_id:
-                recommendation_list.append(list(sorted_rules.iloc[i]["consequents"])[0])
+# The rules are indexed once: every antecedent product maps to the
+# consequents of its rules sorted by lift, so a call is a dict lookup and a
+# slice instead of sorting and scanning every rule
+from rule_index import RuleIndex
+rule_index = RuleIndex(rules)
 
-    return recommendation_list[0:rec_count]
+def arl_recommender(rule_index, product_id, rec_count=1):
+    return rule_index.recommend(product_id, rec_count)
 
 
-arl_recommender(rules, 22492, 1)
+arl_recommender(rule_index, 22492, 1)
 # [22556]
-arl_recommender(rules, 22492, 2)
+arl_recommender(rule_index, 22492, 2)
 # [22556, 22551]
-arl_recommender(rules, 22492, 3)
+arl_recommender(rule_index, 22492, 3)
 # [22556, 22551, 22326]
 
 
 
 
 
+
+# Repeated requests are answered from the in-process result cache (LRU, 10 min
+# TTL), keyed by product, rec_count and the version of the rule index.
+# Saving re-mined rules to the RuleStore drops the cached ARL results.
+from result_cache import ARL, RESULT_CACHE
+arl_recommender = RESULT_CACHE.memoize(ARL, models=("rule_index",))(arl_recommender)
+arl_recommender(rule_index, 22492, 3)
+arl_recommender(rule_index, 22492, 3)
+RuleStore().save("France", create_rules(df))
+rule_index = RuleIndex(RuleStore().load("France"))
+arl_recommender(rule_index, 22492, 3)
+RESULT_CACHE.stats()
+#              hits  misses  evictions  expirations  size  hit_rate
+# entry_point
+# arl             1       2          0            0     1  0.333333
@@ -0,0 +1,50 @@
+############################################
+# Sparse Invoice x Product Basket Matrix
+############################################
+
+# Replaces groupby().sum().unstack().fillna(0).applymap(...) with integer
+# codes: Invoice and StockCode (or Description) are factorized and the
+# invoice x product matrix is assembled directly as a sparse boolean CSR
+# matrix. Rows and columns are sorted like unstack(). A dense boolean
+# DataFrame is only built on demand, for miners that need one.
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+class BasketMatrix:
+    def __init__(self, matrix, invoices, items):
+        self.matrix = sp.csr_matrix(matrix, dtype=bool)
+        self.invoices = pd.Index(invoices, name="Invoice")
+        self.items = pd.Index(items)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def support(self):
+        # share of invoices containing each product
+        return np.diff(self.matrix.tocsc().indptr) / self.shape[0]
+
+    def to_dataframe(self, sparse=False):
+        # The invoice_product_df view (True where the product is in the invoice)
+        if sparse:
+            return pd.DataFrame.sparse.from_spmatrix(self.matrix, index=self.invoices, columns=self.items)
+        return pd.DataFrame(self.matrix.toarray(), index=self.invoices, columns=self.items)
+
+
+def build_basket_matrix(dataframe, id=False):
+    item_col = "StockCode" if id else "Description"
+    invoice_codes, invoices = pd.factorize(dataframe["Invoice"], sort=True)
+    item_codes, items = pd.factorize(dataframe[item_col], sort=True)
+    # lines without an invoice or product are dropped, like groupby does
+    known = (invoice_codes >= 0) & (item_codes >= 0)
+    # duplicate (invoice, product) lines are summed, a product is in the
+    # basket when its total quantity is positive
+    quantity = sp.csr_matrix((dataframe["Quantity"].to_numpy(np.float64)[known],
+                              (invoice_codes[known], item_codes[known])),
+                             shape=(len(invoices), len(items)))
+    in_basket = sp.csr_matrix((quantity.data > 0, quantity.indices, quantity.indptr), shape=quantity.shape)
+    in_basket.eliminate_zeros()
+    return BasketMatrix(in_basket, invoices, pd.Index(items, name=item_col))
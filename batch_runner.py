@@ -0,0 +1,227 @@
+#############################################
+# Parallel Batch Recommendation Jobs
+#############################################
+
+# python batch_runner.py [content|item|neighbors|user ...]
+# Shards catalogue-wide jobs over a ProcessPoolExecutor:
+# - content: top-k similar movies for every row of the TF-IDF matrix
+# - item: the top-k item-item correlation index, one block of movies per task
+# - neighbors: the top-k similar-users index, one block of users per task
+# - user: user-based recommendations for many users
+# The large read-only matrices are written once to a model_store directory
+# (in /dev/shm, i.e. shared memory, where available) and every worker opens
+# them with np.load(mmap_mode="r"), so all processes map the same pages
+# instead of each getting a pickled copy.
+# Only the row / column / user ids of a shard and its results are pickled.
+
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from item_similarity import ItemCoRatingSums, ItemNeighbors, item_block_top_k
+from model_store import load_arrays, save_arrays
+from ratings_matrix import RatingsMatrix
+from similarity_index import TopKIndex, prepare_matrix, query_topk
+from user_neighbors import UserNeighborIndex
+from user_session import UserBasedSession
+from user_similarity import UserCoRatingSums, user_block_top_k
+
+SHARED_KIND = "batch-shared"
+SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# state of a worker process, filled once by _open_shared
+_shared = {}
+
+
+def share_arrays(path, matrices=None, arrays=None, meta=None):
+    # Sparse matrices are stored as their data / indices / indptr arrays
+    stored, formats = dict(arrays or {}), {}
+    for name, matrix in (matrices or {}).items():
+        stored[name + "_data"] = matrix.data
+        stored[name + "_indices"] = matrix.indices
+        stored[name + "_indptr"] = matrix.indptr
+        formats[name] = {"format": matrix.format, "shape": list(matrix.shape)}
+    save_arrays(path, SHARED_KIND, stored, {"matrices": formats, "meta": meta or {}})
+
+
+def open_shared(path):
+    # (matrices, arrays, meta), every array memory-mapped read-only
+    arrays, header = load_arrays(path, SHARED_KIND, mmap=True)
+    matrices = {}
+    for name, info in header["matrices"].items():
+        fmt = sp.csr_matrix if info["format"] == "csr" else sp.csc_matrix
+        parts = (arrays.pop(name + "_data"), arrays.pop(name + "_indices"), arrays.pop(name + "_indptr"))
+        matrices[name] = fmt(parts, shape=tuple(info["shape"]))
+    return matrices, arrays, header["meta"]
+
+
+def _open_shared(path):
+    _shared["matrices"], _shared["arrays"], _shared["meta"] = open_shared(path)
+
+
+def _shards(n, chunk_size):
+    return [np.arange(start, min(start + chunk_size, n)) for start in range(0, n, chunk_size)]
+
+
+def _run(task, shards, matrices, arrays=None, meta=None, n_jobs=None, shared_dir=None):
+    with tempfile.TemporaryDirectory(dir=shared_dir or SHARED_DIR) as tmp_dir:
+        path = os.path.join(tmp_dir, "shared")
+        share_arrays(path, matrices, arrays, meta)
+        with ProcessPoolExecutor(max_workers=n_jobs or os.cpu_count(),
+                                 initializer=_open_shared, initargs=(path,)) as pool:
+            return list(pool.map(task, shards))
+
+
+#############################################
+# Content: top-k similar movies of the whole catalogue
+#############################################
+
+def _content_task(rows, k, block_size):
+    matrices = _shared["matrices"]
+    return query_topk(matrices["tfidf"], rows, k=k, block_size=block_size, normalized=True,
+                      matrix_t=matrices["tfidf_t"])
+
+
+def parallel_content_index(tfidf_matrix, k=10, n_jobs=None, chunk_size=4096, block_size=1024,
+                           shared_dir=None):
+    # Same TopKIndex as build_topk_index(tfidf_matrix, k); the transpose is
+    # shared too, so workers do not each build one
+    matrix = prepare_matrix(tfidf_matrix)
+    results = _run(partial(_content_task, k=k, block_size=block_size),
+                   _shards(matrix.shape[0], chunk_size), {"tfidf": matrix, "tfidf_t": matrix.T.tocsr()},
+                   n_jobs=n_jobs, shared_dir=shared_dir)
+    return TopKIndex(np.concatenate([neighbors for neighbors, _ in results]),
+                     np.concatenate([scores for _, scores in results]))
+
+
+#############################################
+# Item: top-k item-item correlation index
+#############################################
+
+def _item_task(columns, k, min_common, shrinkage, block_size):
+    if "item_sums" not in _shared:
+        _shared["item_sums"] = ItemCoRatingSums(_shared["matrices"]["stacked"])
+    blocks = [item_block_top_k(_shared["item_sums"], columns[start:start + block_size],
+                               k, min_common, shrinkage)
+              for start in range(0, len(columns), block_size)]
+    return tuple(np.concatenate(parts) for parts in zip(*blocks))
+
+
+def parallel_item_index(ratings, k=50, min_common=2, shrinkage=0, n_jobs=None, chunk_size=1024,
+                        block_size=256, shared_dir=None):
+    # Same ItemNeighbors as build_item_index(ratings, k, ...)
+    co_sums = ItemCoRatingSums.from_ratings(ratings.matrix)
+    k = min(k, ratings.shape[1] - 1)
+    results = _run(partial(_item_task, k=k, min_common=min_common, shrinkage=shrinkage,
+                           block_size=block_size),
+                   _shards(ratings.shape[1], chunk_size), {"stacked": co_sums.stacked},
+                   n_jobs=n_jobs, shared_dir=shared_dir)
+    neighbors, scores, supports = (np.concatenate(parts) for parts in zip(*results))
+    return ItemNeighbors(ratings.titles, TopKIndex(neighbors, scores), supports,
+                         {"min_common": min_common, "shrinkage": shrinkage})
+
+
+#############################################
+# Neighbors: top-k similar-users index
+#############################################
+
+def _neighbors_task(rows, k, ratio, block_size):
+    matrices = _shared["matrices"]
+    if "user_sums" not in _shared:
+        _shared["user_sums"] = UserCoRatingSums(matrices["user_stacked"], matrices["user_right"])
+    n_watched = np.diff(matrices["user_movie"].indptr)
+    blocks = [user_block_top_k(_shared["user_sums"], rows[start:start + block_size], n_watched, k, ratio)
+              for start in range(0, len(rows), block_size)]
+    return tuple(np.concatenate(parts) for parts in zip(*blocks))
+
+
+def parallel_user_neighbors(ratings, k=200, ratio=60, n_jobs=None, chunk_size=1024, block_size=32,
+                            shared_dir=None):
+    # Same UserNeighborIndex as UserNeighborIndex.build(ratings, k, ratio)
+    co_sums = UserCoRatingSums.from_ratings(ratings.matrix)
+    k = min(k, ratings.shape[0] - 1)
+    results = _run(partial(_neighbors_task, k=k, ratio=ratio, block_size=block_size),
+                   _shards(ratings.shape[0], chunk_size),
+                   {"user_movie": ratings.matrix, "user_stacked": co_sums.stacked, "user_right": co_sums.right},
+                   n_jobs=n_jobs, shared_dir=shared_dir)
+    neighbors, scores = (np.concatenate(parts) for parts in zip(*results))
+    return UserNeighborIndex(ratings, TopKIndex(neighbors, scores), ratio, block_size)
+
+
+#############################################
+# User: user-based recommendations for many users
+#############################################
+
+def _worker_session():
+    if "session" not in _shared:
+        matrices, arrays, meta = _shared["matrices"], _shared["arrays"], _shared["meta"]
+        user_movie_matrix = RatingsMatrix(matrices["user_movie"], arrays["matrix_user_ids"],
+                                          meta["matrix_titles"])
+        ratings = matrices["ratings"]
+        present = sp.csr_matrix((arrays["present_data"], ratings.indices, ratings.indptr), shape=ratings.shape)
+        session = UserBasedSession(user_movie_matrix, ratings, arrays["user_ids"], arrays["movie_ids"],
+                                   meta["titles"], present=present)
+        session._co_sums = UserCoRatingSums(matrices["user_stacked"], matrices["user_right"])
+        _shared["session"] = session
+    return _shared["session"]
+
+
+def _user_task(user_ids, ratio, cor_th, score, block_size):
+    return _worker_session().recommend_batch(user_ids, ratio=ratio, cor_th=cor_th, score=score,
+                                             block_size=block_size)
+
+
+def parallel_user_recommendations(session, user_ids=None, ratio=60, cor_th=0.65, score=3.5,
+                                  n_jobs=None, chunk_size=512, block_size=32, shared_dir=None):
+    # Same long-format frame as session.recommend_batch(user_ids, ...);
+    # every user of the user x movie matrix by default
+    if user_ids is None:
+        user_ids = session.user_movie_matrix.user_ids
+    user_ids = np.asarray(user_ids)
+    matrices = {"user_movie": session.user_movie_matrix.matrix,
+                "ratings": session.ratings,
+                "user_stacked": session.co_sums.stacked,
+                "user_right": session.co_sums.right}
+    arrays = {"matrix_user_ids": session.user_movie_matrix.user_ids,
+              "user_ids": session.user_index.to_numpy(),
+              "movie_ids": session.movie_ids,
+              "present_data": session.present.data}
+    meta = {"matrix_titles": session.user_movie_matrix.titles.tolist(),
+            "titles": session.titles.tolist()}
+    results = _run(partial(_user_task, ratio=ratio, cor_th=cor_th, score=score, block_size=block_size),
+                   [user_ids[shard] for shard in _shards(len(user_ids), chunk_size)],
+                   matrices, arrays, meta, n_jobs=n_jobs, shared_dir=shared_dir)
+    return pd.concat(results, ignore_index=True)
+
+
+if __name__ == "__main__":
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from content_model import save_content_model
+    from data_loader import load_movies_metadata
+    from ratings_matrix import load_ratings_matrix
+
+    jobs = sys.argv[1:] or ["content", "item", "neighbors", "user"]
+    os.makedirs("models", exist_ok=True)
+    if "content" in jobs:
+        df = load_movies_metadata()
+        tfidf = TfidfVectorizer(stop_words="english")
+        tfidf_matrix = tfidf.fit_transform(df['overview'].fillna(''))
+        sim_index = parallel_content_index(tfidf_matrix)
+        save_content_model("models/content_model", tfidf, tfidf_matrix, sim_index, df['title'])
+        print("content:", len(sim_index), "movies -> models/content_model")
+    if "item" in jobs:
+        item_index = parallel_item_index(load_ratings_matrix(min_count=1000), min_common=50, shrinkage=100)
+        item_index.save("models/item_index")
+        print("item:", len(item_index.titles), "movies -> models/item_index")
+    if "neighbors" in jobs:
+        neighbor_index = parallel_user_neighbors(load_ratings_matrix(min_count=1000), k=200, ratio=60)
+        neighbor_index.save("models/user_neighbors")
+        print("neighbors:", len(neighbor_index.neighbors), "users -> models/user_neighbors")
+    if "user" in jobs:
+        recommendations = parallel_user_recommendations(UserBasedSession.load())
+        recommendations.to_csv("models/user_recommendations.csv", index=False)
+        print("user:", recommendations["userId"].nunique(), "users -> models/user_recommendations.csv")
@@ -0,0 +1,67 @@
+#############################
+# ALS Benchmark: matrix factorization against user_based_recommender
+#############################
+
+# python benchmark_als.py
+# Loads the MovieLens ratings into a UserBasedSession, fits ImplicitALS on
+# the same ratings and reports, for a sample of users, the latency per
+# recommendation (mean and p99), the peak memory allocated while serving and
+# the memory of the structures each method keeps.
+
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from als_model import ImplicitALS
+from user_session import UserBasedSession
+
+
+def _sparse_mb(matrix):
+    return (matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) / 2 ** 20
+
+
+def _measure(recommend, users):
+    latencies = []
+    for user in users:
+        start = time.perf_counter()
+        recommend(user)
+        latencies.append((time.perf_counter() - start) * 1000)
+    # allocations are traced in a second pass, tracing slows the calls down
+    tracemalloc.start()
+    for user in users[:20]:
+        recommend(user)
+    peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return np.mean(latencies), np.percentile(latencies, 99), peak_mb
+
+
+def run_benchmark(session, n_users=200, factors=64, iterations=10, k=10, n_jobs=1, random_state=0):
+    rng = np.random.default_rng(random_state)
+    users = rng.choice(session.user_movie_matrix.user_ids, min(n_users, session.user_movie_matrix.shape[0]),
+                       replace=False)
+
+    user_based = _measure(lambda user: session.recommend(user), users)
+    user_based_mb = _sparse_mb(session.ratings) + _sparse_mb(session.user_movie_matrix.matrix)
+
+    start = time.perf_counter()
+    model = ImplicitALS(factors=factors, iterations=iterations, n_jobs=n_jobs,
+                        random_state=random_state).fit(session.ratings)
+    fit_s = time.perf_counter() - start
+    indptr, indices = session.ratings.indptr, session.ratings.indices
+
+    def als_recommend(user):
+        # the user's rated movies are excluded, like in user_based_recommender
+        pos = session.user_index.get_loc(user)
+        return model.recommend(pos, k, exclude=indices[indptr[pos]:indptr[pos + 1]])
+
+    als = _measure(als_recommend, users)
+    als_mb = (model.user_factors.nbytes + model.item_factors.nbytes) / 2 ** 20
+
+    return pd.DataFrame([{"method": "user_based", "fit_s": 0.0, "ms_per_user": user_based[0],
+                          "p99_ms": user_based[1], "peak_query_mb": user_based[2], "model_mb": user_based_mb},
+                         {"method": "als", "fit_s": fit_s, "ms_per_user": als[0],
+                          "p99_ms": als[1], "peak_query_mb": als[2], "model_mb": als_mb}])
+
+
+if __name__ == "__main__":
+    print(run_benchmark(UserBasedSession.load()))
@@ -0,0 +1,54 @@
+#############################
+# IVF ANN Benchmark: recall@10 against exact cosine search
+#############################
+
+# python benchmark_ann.py
+# Fits the TF-IDF matrix of movies_metadata.csv, builds an IVFIndex and
+# reports recall@10 and latency per query for several n_probe values.
+
+import time
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+from ann_index import IVFIndex
+from data_loader import load_movies_metadata
+from similarity_index import prepare_matrix, query_topk
+
+
+def run_benchmark(tfidf_matrix, n_clusters=256, n_probes=(1, 2, 4, 8, 16, 32), k=10,
+                  n_queries=500, random_state=0):
+    matrix = prepare_matrix(tfidf_matrix)
+    rng = np.random.default_rng(random_state)
+    queries = rng.choice(matrix.shape[0], min(n_queries, matrix.shape[0]), replace=False)
+
+    # exact search timed one query at a time, like the IVF queries below; the
+    # transpose is built once, as a serving process would
+    matrix_t = matrix.T.tocsr()
+    start = time.perf_counter()
+    exact = np.vstack([query_topk(matrix, [query], k=k, normalized=True, matrix_t=matrix_t)[0]
+                       for query in queries])
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    start = time.perf_counter()
+    index = IVFIndex(n_clusters=n_clusters, random_state=random_state).fit(matrix, normalized=True)
+    fit_s = time.perf_counter() - start
+
+    results = []
+    for n_probe in n_probes:
+        start = time.perf_counter()
+        found = [index.query(query, k=k, n_probe=n_probe)[0] for query in queries]
+        latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+        hits = sum(len(np.intersect1d(items, truth)) for items, truth in zip(found, exact))
+        results.append({"n_probe": n_probe,
+                        f"recall@{k}": hits / exact.size,
+                        "ms_per_query": latency_ms,
+                        "exact_ms_per_query": exact_ms,
+                        "fit_s": fit_s})
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    df = load_movies_metadata()
+    tfidf = TfidfVectorizer(stop_words="english")
+    tfidf_matrix = tfidf.fit_transform(df['overview'].fillna(''))
+    print(run_benchmark(tfidf_matrix))
@@ -0,0 +1,49 @@
+#############################
+# Frequent Itemset Benchmark: Eclat against mlxtend apriori
+#############################
+
+# python benchmark_itemsets.py
+# Builds the basket matrix of every country in online_retail_II.xlsx and
+# reports apriori and eclat run times and whether both found the same
+# itemsets with the same supports.
+
+import time
+import pandas as pd
+from mlxtend.frequent_patterns import apriori
+from basket_matrix import build_basket_matrix
+from data_loader import load_online_retail
+from itemset_mining import eclat
+from retail_prep import retail_data_prep
+
+
+def run_benchmark(dataframe, countries=None, min_support=0.01, id=True, max_len=None):
+    countries = countries or dataframe["Country"].value_counts().index.tolist()
+    results = []
+    for country in countries:
+        basket = build_basket_matrix(dataframe[dataframe["Country"] == country], id)
+
+        start = time.perf_counter()
+        expected = apriori(basket.to_dataframe(), min_support=min_support, use_colnames=True,
+                           max_len=max_len)
+        apriori_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = eclat(basket, min_support=min_support, use_colnames=True, max_len=max_len)
+        eclat_s = time.perf_counter() - start
+
+        same = dict(zip(expected["itemsets"], expected["support"])) == \
+            dict(zip(found["itemsets"], found["support"]))
+        results.append({"country": country,
+                        "invoices": basket.shape[0],
+                        "products": basket.shape[1],
+                        "itemsets": len(found),
+                        "apriori_s": apriori_s,
+                        "eclat_s": eclat_s,
+                        "speedup": apriori_s / max(eclat_s, 1e-9),
+                        "same_output": same})
+    return pd.DataFrame(results)
+
+
+if __name__ == "__main__":
+    df = retail_data_prep(load_online_retail())
+    print(run_benchmark(df, ["France", "Germany", "Spain", "Belgium", "Netherlands"]))
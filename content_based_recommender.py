@@ -7,7 +7,7 @@
 #############################
 
 # 1. Creating the TF-IDF Matrix
-# 2. Creating the Cosine Similarity Matrix
+# 2. Creating the Top-k Cosine Similarity Index
 # 3. Making Suggestions Based on Similarities
 # 4. Preparation of Working Script
 
@@ -20,9 +20,11 @@ pd.set_option('display.max_columns', None)
 pd.set_option('display.width', 500)
 pd.set_option('display.expand_frame_repr', False)
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from similarity_index import build_topk_index
+from content_model import ContentRecommender, save_content_model
+from data_loader import load_movies_metadata
 # https://www.kaggle.com/rounakbanik/the-movies-dataset
-df = pd.read_csv("datasets/the_movies_dataset/movies_metadata.csv", low_memory=False)  # for close DtypeWarning
+df = load_movies_metadata()  # parsed once, then loaded from the typed cache
 df.head()
 #    adult                              belongs_to_collection    budget                                             genres                              homepage     id    imdb_id original_language               original_title                                           overview popularity                       poster_path                               production_companies                               production_countries release_date      revenue  runtime                                   spoken_languages    status                                            tagline                        title  video  vote_average  vote_count
 # 0  False  {'id': 10194, 'name': 'Toy Story Collection', ...  30000000  [{'id': 16, 'name': 'Animation'}, {'id': 35, '...  http://toystory.disney.com/toy-story    862  tt0114709                en                    Toy Story  Led by Woody, Andy's toys live happily in his ...  21.946943  /rhIRbceoE9lR4veEXuwCC2wARtG.jpg     [{'name': 'Pixar Animation Studios', 'id': 3}]  [{'iso_3166_1': 'US', 'name': 'United States o...   1995-10-30  373554033.0     81.0           [{'iso_639_1': 'en', 'name': 'English'}]  Released                                                NaN                    Toy Story  False           7.7      5415.0
@@ -65,18 +67,16 @@ tfidf_matrix.toarray()
 
 
 #################################
-# 2. Creating the Cosine Similarity Matrix
+# 2. Creating the Top-k Cosine Similarity Index
 #################################
 
-cosine_sim = cosine_similarity(tfidf_matrix,
-                               tfidf_matrix)
+# cosine_similarity(tfidf_matrix, tfidf_matrix) would be a dense 45466 x 45466
+# float64 matrix (~16 GB). Only the 10 most similar movies of each movie are
+# kept instead, computed block by block to bound peak memory.
+sim_index = build_topk_index(tfidf_matrix, k=10, block_size=1024)
 
-cosine_sim.shape
-# (45466, 45466)
-
-cosine_sim[1]
-# array([0.01504121, 1.        , 0.04681953, ..., 0.        , 0.02198641,
-#        0.00929411])
+sim_index.neighbors.shape
+# (45466, 10)
 
 #################################
 # 3. Making Suggestions Based on Similarities
@@ -107,14 +107,8 @@ indices["Sherlock Holmes"]
 # 35116
 movie_index = indices["Sherlock Holmes"]
 
-cosine_sim[movie_index]
-# array([0.        , 0.00392837, 0.00476764, ..., 0.        , 0.0067919 ,
-#        0.        ])
-
-similarity_scores = pd.DataFrame(cosine_sim[movie_index],
-                                 columns=["score"])
-
-movie_indices = similarity_scores.sort_values("score", ascending=False)[1:11].index
+# the movie itself is already excluded from its neighbours
+movie_indices, scores = sim_index.query(movie_index)
 
 df['title'].iloc[movie_indices]
 # 34737    Приключения Шерлока Холмса и доктора Ватсона: ...
@@ -133,19 +127,14 @@ df['title'].iloc[movie_indices]
 # 4. Preparation of Working Script
 #################################
 
-def content_based_recommender(title, cosine_sim, dataframe):
-    # Creating indexes
-    indices = pd.Series(dataframe.index, index=dataframe['title'])
-    indices = indices[~indices.index.duplicated(keep='last')]
-    # capture title's index
-    movie_index = indices[title]
-    # Calculating similarity scores based on title
-    similarity_scores = pd.DataFrame(cosine_sim[movie_index], columns=["score"])
-    # Don't list the top 10 movies except it
-    movie_indices = similarity_scores.sort_values("score", ascending=False)[1:11].index
-    return dataframe['title'].iloc[movie_indices]
-
-content_based_recommender("Sherlock Holmes", cosine_sim, df)
+# The title index is built once and reused for every request
+recommender = ContentRecommender.from_dataframe(df, sim_index, tfidf_matrix)
+
+def content_based_recommender(title, recommender, rec_count=10, ignore_case=False):
+    # Top rec_count most similar movies, the movie itself excluded
+    return recommender.recommend(title, k=rec_count, ignore_case=ignore_case)
+
+content_based_recommender("Sherlock Holmes", recommender)
 # 34737    Приключения Шерлока Холмса и доктора Ватсона: ...
 # 14821                                    The Royal Scandal
 # 34750    The Adventures of Sherlock Holmes and Doctor W...
@@ -158,7 +147,7 @@ content_based_recommender("Sherlock Holmes", cosine_sim, df)
 # 29154                          Sherlock Holmes in New York
 # Name: title, dtype: object
 
-content_based_recommender("The Matrix", cosine_sim, df)
+content_based_recommender("The Matrix", recommender)
 # 44161                        A Detective Story
 # 44167                              Kid's Story
 # 44163                             World Record
@@ -171,7 +160,7 @@ content_based_recommender("The Matrix", cosine_sim, df)
 # 9159                                  Takedown
 # Name: title, dtype: object
 
-content_based_recommender("The Godfather", cosine_sim, df)
+content_based_recommender("The Godfather", recommender)
 # 1178               The Godfather: Part II
 # 44030    The Godfather Trilogy: 1972-1990
 # 1914              The Godfather: Part III
@@ -184,7 +173,7 @@ content_based_recommender("The Godfather", cosine_sim, df)
 # 26293                  Beck 28 - Familjen
 # Name: title, dtype: object
 
-content_based_recommender('The Dark Knight Rises', cosine_sim, df)
+content_based_recommender('The Dark Knight Rises', recommender)
 # 12481                                      The Dark Knight
 # 150                                         Batman Forever
 # 1328                                        Batman Returns
@@ -196,3 +185,63 @@ content_based_recommender('The Dark Knight Rises', cosine_sim, df)
 # 19792              Batman: The Dark Knight Returns, Part 1
 # 3095                          Batman: Mask of the Phantasm
 # Name: title, dtype: object
+
+content_based_recommender('the dark knight rises', recommender, ignore_case=True).head(3)
+# 12481    The Dark Knight
+# 150       Batman Forever
+# 1328      Batman Returns
+# Name: title, dtype: object
+
+recommender.recommend_many(["Sherlock Holmes", "The Matrix", "The Godfather"])
+
+# Many titles at once: one chunked sparse product against the TF-IDF matrix
+recommender.recommend_batch(["Sherlock Holmes", "The Matrix"], k=3)
+#              query  rank  index                                              title     score
+# 0  Sherlock Holmes     1  34737  Приключения Шерлока Холмса и доктора Ватсона: ...  ...
+# 1  Sherlock Holmes     2  14821                                  The Royal Scandal  ...
+# 2  Sherlock Holmes     3  34750  The Adventures of Sherlock Holmes and Doctor W...  ...
+# 3       The Matrix     1  44161                                  A Detective Story  ...
+# 4       The Matrix     2  44167                                        Kid's Story  ...
+# 5       The Matrix     3  44163                                       World Record  ...
+
+# Approximate search for large catalogues: only the n_probe closest clusters
+# are scored (python benchmark_ann.py reports recall@10 vs exact search)
+from ann_index import IVFIndex
+ann_index = IVFIndex(n_clusters=256, n_probe=8).fit(tfidf_matrix)
+ann_recommender = ContentRecommender.from_dataframe(df, ann_index)
+ann_recommender.recommend("Sherlock Holmes")
+
+# Persisting the fitted model: later runs and worker processes memory-map the
+# saved arrays instead of refitting TF-IDF and recomputing similarities
+save_content_model("models/content_model", tfidf, tfidf_matrix, sim_index, df['title'])
+recommender = ContentRecommender.load("models/content_model")
+recommender.recommend("Sherlock Holmes")
+
+# Hourly catalogue updates: only the new/changed overviews are transformed and
+# only the neighbour lists they affect are updated. RebuildPolicy triggers a
+# full refit once the frozen IDF weights have drifted too far.
+from content_updates import IncrementalContentModel, RebuildPolicy
+content_model = IncrementalContentModel(tfidf, tfidf_matrix, sim_index, df['title'], df['overview'],
+                                        policy=RebuildPolicy(max_new_fraction=0.2, max_oov_rate=0.1,
+                                                             max_idf_drift=0.05))
+content_model.update(["A Brand New Movie"], ["A detective and his friend solve a mystery in London."])
+# None  -> incremental update, no rebuild needed
+content_model.drift()
+content_model.recommender().recommend("A Brand New Movie")
+
+# Repeated requests are answered from the in-process result cache (LRU, 10 min
+# TTL). The recommender enters the key through its version, and updating,
+# rebuilding or saving the content model drops the cached content results.
+# A recommender is a snapshot of the model, so take a new one after an update.
+from result_cache import CONTENT, RESULT_CACHE
+content_based_recommender = RESULT_CACHE.memoize(CONTENT, models=("recommender",))(content_based_recommender)
+recommender = content_model.recommender()
+content_based_recommender("Sherlock Holmes", recommender)
+content_based_recommender("Sherlock Holmes", recommender)
+content_model.update(["Another New Movie"], ["Sherlock Holmes returns to Baker Street."])
+recommender = content_model.recommender()
+content_based_recommender("Sherlock Holmes", recommender)
+RESULT_CACHE.stats()
+#              hits  misses  evictions  expirations  size  hit_rate
+# entry_point
+# content         1       2          0            0     1  0.333333
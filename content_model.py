@@ -0,0 +1,125 @@
+#############################
+# Content Based Recommender Model
+#############################
+
+# Builds the title -> row lookup once and answers any number of title
+# queries against a top-k similarity index (see similarity_index.py) or,
+# for very large catalogues, an approximate IVFIndex (see ann_index.py).
+# With the TF-IDF matrix attached, many titles can also be answered at once
+# straight from the vectors. save_content_model / load_content_model persist
+# the fitted vectorizer, the matrix and the index (see model_store.py).
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from model_store import load_arrays, save_arrays
+from result_cache import CONTENT, RESULT_CACHE
+from similarity_index import TopKIndex, prepare_matrix, query_topk
+
+
+class ContentRecommender:
+    def __init__(self, titles, sim_index, tfidf_matrix=None, normalized=False):
+        self.titles = pd.Series(titles)
+        self.sim_index = sim_index
+        self.matrix = tfidf_matrix
+        if tfidf_matrix is not None and not normalized:
+            self.matrix = prepare_matrix(tfidf_matrix)
+        self._build_lookup()
+
+    @classmethod
+    def from_dataframe(cls, dataframe, sim_index, tfidf_matrix=None, title_col="title"):
+        return cls(dataframe[title_col], sim_index, tfidf_matrix)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        tfidf, matrix, sim_index, titles = load_content_model(path, mmap=mmap)
+        return cls(titles, sim_index, matrix, normalized=True)
+
+    def _build_lookup(self):
+        # Duplicated titles resolve to their last occurrence, like
+        # indices[~indices.index.duplicated(keep='last')]
+        self._exact = {}
+        self._casefold = {}
+        for position, title in enumerate(self.titles.values):
+            if not isinstance(title, str):
+                continue
+            self._exact[title] = position
+            self._casefold[title.casefold()] = position
+
+    def __contains__(self, title):
+        return title in self._exact
+
+    def index_of(self, title, ignore_case=False):
+        position = self._exact.get(title)
+        if position is None and ignore_case and isinstance(title, str):
+            position = self._casefold.get(title.casefold())
+        if position is None:
+            raise KeyError(title)
+        return position
+
+    def recommend(self, title, k=10, ignore_case=False):
+        movie_index = self.index_of(title, ignore_case=ignore_case)
+        movie_indices, scores = self.sim_index.query(movie_index, k=k)
+        return self.titles.iloc[movie_indices]
+
+    def recommend_many(self, titles, k=10, ignore_case=False):
+        return {title: self.recommend(title, k=k, ignore_case=ignore_case) for title in titles}
+
+    def recommend_batch(self, titles, k=10, block_size=1024, ignore_case=False):
+        # Long format result: one row per (query title, neighbour)
+        if self.matrix is None:
+            raise ValueError("recommend_batch needs the tfidf_matrix")
+        titles = list(titles)
+        query_rows = np.array([self.index_of(title, ignore_case=ignore_case) for title in titles],
+                              dtype=np.int64)
+        neighbors, scores = query_topk(self.matrix, query_rows, k=k, block_size=block_size,
+                                       normalized=True)
+        k = neighbors.shape[1]
+        return pd.DataFrame({"query": np.repeat(titles, k),
+                             "rank": np.tile(np.arange(1, k + 1), len(titles)),
+                             "index": self.titles.index[neighbors.ravel()],
+                             "title": self.titles.values[neighbors.ravel()],
+                             "score": scores.ravel()})
+
+
+CONTENT_MODEL_KIND = "content-model"
+_VECTORIZER_PARAMS = ("analyzer", "binary", "lowercase", "max_df", "min_df", "max_features",
+                      "ngram_range", "norm", "smooth_idf", "stop_words", "strip_accents",
+                      "sublinear_tf", "token_pattern", "use_idf")
+
+
+def save_content_model(path, tfidf, tfidf_matrix, sim_index, titles):
+    matrix = prepare_matrix(tfidf_matrix)
+    titles = pd.Series(titles)
+    vocabulary = np.empty(len(tfidf.vocabulary_), dtype=object)
+    for term, column in tfidf.vocabulary_.items():
+        vocabulary[column] = term
+    params = tfidf.get_params()
+    save_arrays(path, CONTENT_MODEL_KIND,
+                {"vocabulary": vocabulary.astype(str),
+                 "idf": tfidf.idf_,
+                 "data": matrix.data,
+                 "indices": matrix.indices,
+                 "indptr": matrix.indptr,
+                 "neighbors": sim_index.neighbors,
+                 "scores": sim_index.scores},
+                {"shape": list(matrix.shape),
+                 "vectorizer": {name: params[name] for name in _VECTORIZER_PARAMS},
+                 "title_index": titles.index.tolist(),
+                 "titles": [title if isinstance(title, str) else None for title in titles]})
+    RESULT_CACHE.invalidate(CONTENT)
+
+
+def load_content_model(path, mmap=True):
+    arrays, meta = load_arrays(path, CONTENT_MODEL_KIND, mmap=mmap)
+    params = dict(meta["vectorizer"])
+    params["ngram_range"] = tuple(params["ngram_range"])
+    tfidf = TfidfVectorizer(**params)
+    tfidf.vocabulary_ = {term: column for column, term in enumerate(arrays["vocabulary"].tolist())}
+    tfidf.idf_ = arrays["idf"]
+    matrix = sp.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]),
+                           shape=tuple(meta["shape"]), copy=False)
+    sim_index = TopKIndex(arrays["neighbors"], arrays["scores"])
+    titles = pd.Series(meta["titles"], index=meta["title_index"], name="title")
+    return tfidf, matrix, sim_index, titles
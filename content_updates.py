@@ -0,0 +1,172 @@
+#############################
+# Incremental Content Model Updates
+#############################
+
+# New or changed overviews are transformed with the already fitted
+# vocabulary and IDF weights, and only the neighbour lists they can affect
+# are updated:
+# 1. Updated rows get a fresh exact top-k.
+# 2. Rows that listed a changed movie as a neighbour are recomputed (stale).
+# 3. Every other row only merges the updated rows into its list when they
+#    beat its current k-th score.
+# The IDF weights stay frozen between rebuilds. RebuildPolicy decides when
+# they have drifted too far and a full refit is due.
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from content_model import ContentRecommender
+from result_cache import CONTENT, RESULT_CACHE
+from similarity_index import TopKIndex, build_topk_index, merge_top_k, prepare_matrix, query_topk
+
+
+class RebuildPolicy:
+    # max_new_fraction: documents added/changed since the last fit, relative to it
+    # max_oov_rate: share of new tokens missing from the fitted vocabulary
+    # max_idf_drift: document-frequency weighted mean relative IDF change
+    def __init__(self, max_new_fraction=0.2, max_oov_rate=0.1, max_idf_drift=0.05):
+        self.max_new_fraction = max_new_fraction
+        self.max_oov_rate = max_oov_rate
+        self.max_idf_drift = max_idf_drift
+
+    def reason(self, new_fraction, oov_rate, idf_drift):
+        if new_fraction > self.max_new_fraction:
+            return f"new_fraction {new_fraction:.3f} > {self.max_new_fraction}"
+        if oov_rate > self.max_oov_rate:
+            return f"oov_rate {oov_rate:.3f} > {self.max_oov_rate}"
+        if idf_drift > self.max_idf_drift:
+            return f"idf_drift {idf_drift:.3f} > {self.max_idf_drift}"
+        return None
+
+
+class IncrementalContentModel:
+    def __init__(self, tfidf, tfidf_matrix, sim_index, titles, overviews, policy=None,
+                 block_size=1024):
+        self.tfidf = tfidf
+        self.policy = policy or RebuildPolicy()
+        self.block_size = block_size
+        self.titles = pd.Series(titles).reset_index(drop=True)
+        self.overviews = pd.Series(overviews).fillna('').reset_index(drop=True)
+        self._reset(prepare_matrix(tfidf_matrix), sim_index)
+
+    @classmethod
+    def fit(cls, titles, overviews, k=10, policy=None, block_size=1024, **tfidf_params):
+        tfidf = TfidfVectorizer(**(tfidf_params or {"stop_words": "english"}))
+        overviews = pd.Series(overviews).fillna('')
+        tfidf_matrix = tfidf.fit_transform(overviews)
+        sim_index = build_topk_index(tfidf_matrix, k=k, block_size=block_size)
+        return cls(tfidf, tfidf_matrix, sim_index, titles, overviews, policy, block_size)
+
+    def _reset(self, matrix, sim_index):
+        self.matrix = matrix
+        # writable copies, the index may come from a read-only memory map
+        self.neighbors = np.array(sim_index.neighbors)
+        self.scores = np.array(sim_index.scores)
+        self.fitted_docs = matrix.shape[0]
+        self.updated_docs = 0
+        self.oov_tokens = 0
+        self.total_tokens = 0
+        self.doc_freq = np.bincount(matrix.indices, minlength=matrix.shape[1])
+        self.last_rebuild_reason = None
+
+    @property
+    def sim_index(self):
+        return TopKIndex(self.neighbors, self.scores)
+
+    def recommender(self):
+        # a snapshot of the current model: update / rebuild replace the
+        # matrix, titles and neighbour arrays, so take a new one afterwards
+        return ContentRecommender(self.titles, self.sim_index, self.matrix, normalized=True)
+
+    def drift(self):
+        n_docs = self.matrix.shape[0]
+        smooth = int(self.tfidf.smooth_idf)
+        current_idf = np.log((n_docs + smooth) / (self.doc_freq + smooth)) + 1
+        fitted_idf = self.tfidf.idf_
+        weights = self.doc_freq / max(self.doc_freq.sum(), 1)
+        return {"new_fraction": self.updated_docs / max(self.fitted_docs, 1),
+                "oov_rate": self.oov_tokens / max(self.total_tokens, 1),
+                "idf_drift": float(weights @ (np.abs(current_idf - fitted_idf) / fitted_idf))}
+
+    def update(self, titles, overviews, rows=None):
+        # rows: positions of changed movies; None (or -1 entries) appends new ones
+        titles = list(titles)
+        if not titles:
+            return None
+        overviews = pd.Series(list(overviews), dtype=object).fillna('').tolist()
+        n_items = self.matrix.shape[0]
+        rows = np.full(len(titles), -1) if rows is None else np.asarray(rows)
+        appended = rows < 0
+        rows = rows.copy()
+        rows[appended] = n_items + np.arange(appended.sum())
+        changed = rows[~appended]
+
+        new_rows = prepare_matrix(self.tfidf.transform(overviews))
+        self._track_drift(overviews, new_rows, changed)
+        self._apply_rows(rows, new_rows, titles, overviews)
+
+        self.last_rebuild_reason = self.policy.reason(**self.drift())
+        if self.last_rebuild_reason is not None:
+            self.rebuild()
+        else:
+            self._update_neighbors(rows, changed)
+            RESULT_CACHE.invalidate(CONTENT)
+        return self.last_rebuild_reason
+
+    def _track_drift(self, overviews, new_rows, changed):
+        analyzer = self.tfidf.build_analyzer()
+        vocabulary = self.tfidf.vocabulary_
+        for text in overviews:
+            tokens = analyzer(text)
+            self.total_tokens += len(tokens)
+            self.oov_tokens += sum(token not in vocabulary for token in tokens)
+        if len(changed):
+            self.doc_freq -= np.bincount(self.matrix[changed].indices, minlength=len(self.doc_freq))
+        self.doc_freq += np.bincount(new_rows.indices, minlength=len(self.doc_freq))
+        self.updated_docs += len(overviews)
+
+    def _apply_rows(self, rows, new_rows, titles, overviews):
+        n_items = self.matrix.shape[0]
+        n_total = max(n_items, rows.max() + 1)
+        # stacked rows [old..., new...] reordered so every updated position
+        # points at its new row
+        order = np.arange(n_total)
+        order[rows] = n_items + np.arange(len(rows))
+        self.matrix = sp.vstack([self.matrix, new_rows], format="csr")[order]
+
+        n_added = n_total - n_items
+        if n_added:
+            self.neighbors = np.vstack([self.neighbors,
+                                        np.full((n_added, self.neighbors.shape[1]), -1, dtype=np.int32)])
+            self.scores = np.vstack([self.scores,
+                                     np.zeros((n_added, self.scores.shape[1]), dtype=np.float32)])
+            self.titles = pd.concat([self.titles, pd.Series([None] * n_added)], ignore_index=True)
+            self.overviews = pd.concat([self.overviews, pd.Series([''] * n_added)], ignore_index=True)
+        self.titles.iloc[rows] = titles
+        self.overviews.iloc[rows] = overviews
+
+    def _update_neighbors(self, rows, changed):
+        k = self.neighbors.shape[1]
+        stale = np.flatnonzero(np.isin(self.neighbors, changed).any(axis=1))
+        recompute = np.union1d(rows, stale)
+        if len(recompute):
+            neighbors, scores = query_topk(self.matrix, recompute, k=k, block_size=self.block_size,
+                                           normalized=True)
+            self.neighbors[recompute, :neighbors.shape[1]] = neighbors
+            self.scores[recompute, :scores.shape[1]] = scores
+
+        # Rows left untouched only need the updated movies merged in
+        others = np.setdiff1d(np.arange(self.matrix.shape[0]), recompute)
+        similarity = (self.matrix @ self.matrix[rows].T).tocsr()[others].toarray()
+        merge_top_k(self.neighbors, self.scores, others, rows, similarity)
+
+    def rebuild(self):
+        # Full refit: new vocabulary and IDF weights, exact index from scratch
+        self.tfidf = TfidfVectorizer(**self.tfidf.get_params())
+        tfidf_matrix = self.tfidf.fit_transform(self.overviews)
+        sim_index = build_topk_index(tfidf_matrix, k=self.neighbors.shape[1], block_size=self.block_size)
+        reason = self.last_rebuild_reason
+        self._reset(prepare_matrix(tfidf_matrix), sim_index)
+        self.last_rebuild_reason = reason
+        RESULT_CACHE.invalidate(CONTENT)
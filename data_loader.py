@@ -0,0 +1,151 @@
+############################################
+# Cached Data Loading
+############################################
+
+# Every source file (csv / xlsx) is parsed once and written to a compressed,
+# typed columnar cache (one .npz per source) next to the datasets:
+# - ids become int32, ratings float32, low-cardinality text becomes category
+# - text columns are stored as factorized codes + unique values
+# Later runs load the cache. It is keyed by the source file's size and mtime;
+# when the mtime changed the content hash decides whether it is still valid.
+
+import hashlib
+import json
+import numbers
+import os
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = "datasets/.cache"
+CACHE_VERSION = 1
+
+MOVIE_PATH = "datasets/movie_lens_dataset/movie.csv"
+RATING_PATH = "datasets/movie_lens_dataset/rating.csv"
+MOVIES_METADATA_PATH = "datasets/the_movies_dataset/movies_metadata.csv"
+ONLINE_RETAIL_PATH = "datasets/online_retail_II.xlsx"
+
+_DECODERS = {0: str, 1: int, 2: float, 3: lambda value: value == "True"}
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _kind(value):
+    if isinstance(value, (bool, np.bool_)):
+        return 3
+    if isinstance(value, numbers.Integral):
+        return 1
+    if isinstance(value, numbers.Real):
+        return 2
+    return 0
+
+
+def _encode(dataframe):
+    arrays, columns = {}, []
+    for i, (name, column) in enumerate(dataframe.items()):
+        key = f"c{i}"
+        if isinstance(column.dtype, pd.CategoricalDtype) or column.dtype == object \
+                or pd.api.types.is_string_dtype(column.dtype):
+            codes, uniques = pd.factorize(column, use_na_sentinel=True)
+            values = np.asarray(uniques, dtype=object)
+            # unique values as strings plus their python type, so mixed
+            # columns (e.g. StockCode 10120 / "85123A") keep their values
+            arrays[key + "_codes"] = codes.astype(np.int32)
+            arrays[key + "_values"] = np.array([str(value) for value in values], dtype=str)
+            arrays[key + "_kinds"] = np.array([_kind(value) for value in values], dtype=np.int8)
+            kind = "category" if isinstance(column.dtype, pd.CategoricalDtype) else "object"
+        elif pd.api.types.is_datetime64_any_dtype(column.dtype):
+            arrays[key] = column.to_numpy(dtype="datetime64[ns]")
+            kind = "datetime"
+        else:
+            arrays[key] = column.to_numpy()
+            kind = "numeric"
+        columns.append({"name": name, "key": key, "kind": kind})
+    return arrays, columns
+
+
+def _decode(arrays, columns):
+    data = {}
+    for column in columns:
+        key, kind = column["key"], column["kind"]
+        if kind in ("category", "object"):
+            values = [_DECODERS[kind_code](value) for value, kind_code
+                      in zip(arrays[key + "_values"].tolist(), arrays[key + "_kinds"].tolist())]
+            codes = arrays[key + "_codes"]
+            if kind == "category":
+                data[column["name"]] = pd.Categorical.from_codes(codes, pd.Index(values, dtype=object))
+            else:
+                uniques = np.empty(len(values) + 1, dtype=object)
+                uniques[:-1] = values
+                uniques[-1] = np.nan
+                data[column["name"]] = uniques[codes]
+        else:
+            data[column["name"]] = arrays[key]
+    return pd.DataFrame(data)
+
+
+def shrink_dtypes(dataframe, int32=(), float32=(), categories=()):
+    for name in int32:
+        dataframe[name] = dataframe[name].astype(np.int32)
+    for name in float32:
+        dataframe[name] = dataframe[name].astype(np.float32)
+    for name in categories:
+        dataframe[name] = dataframe[name].astype("category")
+    return dataframe
+
+
+def cached_read(path, reader, cache_name, **options):
+    # reader(path) -> DataFrame; options (dtype shrinking) are part of the key
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    cache_path = os.path.join(CACHE_DIR, cache_name + ".npz")
+    meta_path = os.path.join(CACHE_DIR, cache_name + ".json")
+    stat = os.stat(path)
+    key = {"source": os.path.abspath(path), "size": stat.st_size, "version": CACHE_VERSION,
+           "options": {name: list(value) for name, value in options.items()}}
+
+    meta = None
+    if os.path.exists(meta_path) and os.path.exists(cache_path):
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+    if meta is not None and meta["key"] == key:
+        if meta["mtime_ns"] != stat.st_mtime_ns and meta["sha256"] == file_hash(path):
+            meta["mtime_ns"] = stat.st_mtime_ns
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+        if meta["mtime_ns"] == stat.st_mtime_ns:
+            with np.load(cache_path, allow_pickle=False) as arrays:
+                return _decode(arrays, meta["columns"])
+
+    dataframe = shrink_dtypes(reader(path), **options)
+    arrays, columns = _encode(dataframe)
+    np.savez_compressed(cache_path, **arrays)
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"key": key, "mtime_ns": stat.st_mtime_ns, "sha256": file_hash(path),
+                   "columns": columns}, f)
+    # decoded from the cache arrays, so the first and later runs return the same dtypes
+    return _decode(arrays, columns)
+
+
+def load_movies(path=MOVIE_PATH):
+    return cached_read(path, pd.read_csv, "movie", int32=["movieId"], categories=["genres"])
+
+
+def load_ratings(path=RATING_PATH):
+    return cached_read(path, lambda p: pd.read_csv(p, parse_dates=["timestamp"]), "rating",
+                       int32=["userId", "movieId"], float32=["rating"])
+
+
+def load_movies_metadata(path=MOVIES_METADATA_PATH):
+    return cached_read(path, lambda p: pd.read_csv(p, low_memory=False), "movies_metadata",
+                       categories=["original_language", "status"])
+
+
+def load_online_retail(path=ONLINE_RETAIL_PATH, sheet_name="Year 2010-2011"):
+    return cached_read(path, lambda p: pd.read_excel(p, sheet_name=sheet_name),
+                       "online_retail_" + sheet_name.replace(" ", "_"),
+                       int32=["Quantity"], categories=["Country"])
@@ -10,8 +10,12 @@
 import pandas as pd
 pd.set_option('display.max_columns', 500)
 pd.set_option('display.width', 500)
-movie = pd.read_csv('datasets/movie_lens_dataset/movie.csv')
-rating = pd.read_csv('datasets/movie_lens_dataset/rating.csv')
+from similarity_index import top_k
+from ratings_matrix import build_ratings_matrix, load_ratings_matrix, pearson_with
+from data_loader import load_movies, load_ratings
+# parsed once, then loaded from the typed cache (int32 ids, float32 ratings)
+movie = load_movies()
+rating = load_ratings()
 df = movie.merge(rating, how="left", on="movieId")
 df.head()
 #    movieId             title                                       genres  userId  rating            timestamp
@@ -41,20 +45,16 @@ df["title"].value_counts().head()
 # Jurassic Park (1993)                59715
 # Name: count, dtype: int64
 
-comment_counts = pd.DataFrame(df["title"].value_counts())
-rare_movies = comment_counts[comment_counts["count"] <= 1000].index
-common_movies = df[~df["title"].isin(rare_movies)]
-common_movies.shape
-# (17766015, 6)
+# Movies with <= 1000 ratings are rare and dropped. The user x movie matrix is
+# a sparse CSR RatingsMatrix instead of the dense NaN-filled pivot_table.
+user_movie_matrix = build_ratings_matrix(movie, rating, min_count=1000)
 
-common_movies["title"].nunique()
+len(user_movie_matrix.titles)
 # 3159
 df["title"].nunique()
 # 27262
 
-user_movie_df = common_movies.pivot_table(index=["userId"], columns=["title"], values="rating")
-
-user_movie_df.shape
+user_movie_matrix.shape
 # (138493, 3159)
 
 ######################################
@@ -62,8 +62,12 @@ user_movie_df.shape
 ######################################
 
 movie_name = "Matrix, The (1999)"
-movie_name = user_movie_df[movie_name]
-user_movie_df.corrwith(movie_name).sort_values(ascending=False).head(10)
+movie_pos = user_movie_matrix.movie_pos(movie_name)
+users, movie_ratings = user_movie_matrix.movie_ratings(movie_pos)
+# pairwise-complete Pearson correlations, the same values as corrwith
+correlations = pearson_with(user_movie_matrix.matrix, users, movie_ratings)
+top = top_k(correlations, 10)
+pd.Series(correlations[top], index=pd.Index(user_movie_matrix.titles[top], name="title"))
 # title
 # Matrix, The (1999)                                           1.000000
 # Matrix Reloaded, The (2003)                                  0.516906
@@ -77,11 +81,14 @@ user_movie_df.corrwith(movie_name).sort_values(ascending=False).head(10)
 # Lord of the Rings: The Fellowship of the Ring, The (2001)    0.318726
 # dtype: float64
 
-movie_name = pd.Series(user_movie_df.columns).sample(1).values[0]
+movie_name = pd.Series(user_movie_matrix.titles).sample(1).values[0]
 movie_name
 # 'Mask, The (1994)'
-movie_name = user_movie_df[movie_name]
-user_movie_df.corrwith(movie_name).sort_values(ascending=False).head(10)
+movie_pos = user_movie_matrix.movie_pos(movie_name)
+users, movie_ratings = user_movie_matrix.movie_ratings(movie_pos)
+correlations = pearson_with(user_movie_matrix.matrix, users, movie_ratings)
+top = top_k(correlations, 10)
+pd.Series(correlations[top], index=pd.Index(user_movie_matrix.titles[top], name="title"))
 # title
 # Mask, The (1994)                         1.000000
 # Liar Liar (1997)                         0.505521
@@ -96,10 +103,10 @@ user_movie_df.corrwith(movie_name).sort_values(ascending=False).head(10)
 # dtype: float64
 
 
-def check_film(keyword, user_movie_df):
-    return [col for col in user_movie_df.columns if keyword in col]
+def check_film(keyword, user_movie_matrix):
+    return [title for title in user_movie_matrix.titles if keyword in title]
 
-check_film("Lord", user_movie_df)
+check_film("Lord", user_movie_matrix)
 # ['Lord of Illusions (1995)',
 #  'Lord of War (2005)',
 #  'Lord of the Flies (1963)',
@@ -115,26 +122,33 @@ check_film("Lord", user_movie_df)
 ######################################
 
 def create_user_movie_df():
-    import pandas as pd
-    movie = pd.read_csv('datasets/movie_lens_dataset/movie.csv')
-    rating = pd.read_csv('datasets/movie_lens_dataset/rating.csv')
-    df = movie.merge(rating, how="left", on="movieId")
-    comment_counts = pd.DataFrame(df["title"].value_counts())
-    rare_movies = comment_counts[comment_counts["count"] <= 1000].index
-    common_movies = df[~df["title"].isin(rare_movies)]
-    user_movie_df = common_movies.pivot_table(index=["userId"], columns=["title"], values="rating")
-    return user_movie_df
+    # Sparse CSR user x movie matrix (integer-coded axes + id maps) instead of
+    # the dense NaN-filled pivot_table; movies with <= 1000 ratings are dropped
+    return load_ratings_matrix(min_count=1000)
+
+user_movie_matrix = create_user_movie_df()
 
-user_movie_df = create_user_movie_df()
+# For rating files larger than memory (MovieLens 25M / 32M) rating.csv can be
+# streamed in chunks: per-movie counts are kept as a running total and only
+# compact id / code / rating arrays of every chunk are held until the matrix
+# is assembled
+# user_movie_matrix = load_ratings_matrix(min_count=1000, chunksize=1_000_000)
+
+user_movie_matrix.shape
+# (138493, 3159)
 
 
-def item_based_recommender(movie_name, user_movie_df):
-    movie_name = user_movie_df[movie_name]
-    return user_movie_df.corrwith(movie_name).sort_values(ascending=False).head(10)
+def item_based_recommender(movie_name, user_movie_matrix, rec_count=10):
+    movie_pos = user_movie_matrix.movie_pos(movie_name)
+    users, movie_ratings = user_movie_matrix.movie_ratings(movie_pos)
+    # Same pairwise-complete Pearson correlations as corrwith, on the sparse matrix
+    correlations = pearson_with(user_movie_matrix.matrix, users, movie_ratings)
+    # Top rec_count correlated movies without sorting all of them, the movie itself excluded
+    top = top_k(correlations, rec_count, exclude=movie_pos)
+    return pd.Series(correlations[top], index=pd.Index(user_movie_matrix.titles[top], name="title"))
 
-item_based_recommender("Matrix, The (1999)", user_movie_df)
+item_based_recommender("Matrix, The (1999)", user_movie_matrix)
 # title
-# Matrix, The (1999)                                           1.000000
 # Matrix Reloaded, The (2003)                                  0.516906
 # Matrix Revolutions, The (2003)                               0.449588
 # Animatrix, The (2003)                                        0.367151
@@ -144,13 +158,13 @@ item_based_recommender("Matrix, The (1999)", user_movie_df)
 # Edge of Tomorrow (2014)                                      0.326762
 # Mission: Impossible (1996)                                   0.320815
 # Lord of the Rings: The Fellowship of the Ring, The (2001)    0.318726
+# ...
 # dtype: float64
 
-movie_name = pd.Series(user_movie_df.columns).sample(1).values[0]
+movie_name = pd.Series(user_movie_matrix.titles).sample(1).values[0]
 
-item_based_recommender(movie_name, user_movie_df)
+item_based_recommender(movie_name, user_movie_matrix)
 # title
-# Sea of Love (1989)                                 1.000000
 # Adventures of Pinocchio, The (1996)                0.678841
 # Guys and Dolls (1955)                              0.575418
 # Marvin's Room (1996)                               0.560090
@@ -160,8 +174,38 @@ item_based_recommender(movie_name, user_movie_df)
 # Futurama: The Beast with a Billion Backs (2008)    0.512989
 # Mask (1985)                                        0.511655
 # Houseguest (1994)                                  0.510609
+# ...
 # dtype: float64
 
 
+######################################
+# Step 5: Precomputed Item-Item Correlation Index
+######################################
 
-
+# Offline: all item-item correlations in one blocked pass, top 50 kept per movie.
+# Pairs with fewer than 50 common raters are dropped and correlations are
+# shrunk by n / (n + 100), so noisy few-rater pairs never reach the index.
+from item_similarity import build_item_index, ItemNeighbors
+item_index = build_item_index(user_movie_matrix, k=50, min_common=50, shrinkage=100)
+item_index.save("models/item_index")
+
+# Online: an O(k) lookup instead of corrwith over every movie
+item_index = ItemNeighbors.load("models/item_index")
+item_index.recommend("Matrix, The (1999)", rec_count=10)
+# Same kind of list as item_based_recommender, but the correlations are shrunk
+# by n / (n + 100) and rare pairs dropped, so the scores (and possibly the
+# order) differ from the corrwith output above
+
+# Repeated requests are answered from the in-process result cache (LRU, 10 min
+# TTL), keyed by movie name, rec_count and the version of the matrix, so a
+# reloaded matrix never answers from the old one's results.
+from result_cache import ITEM, RESULT_CACHE
+item_based_recommender = RESULT_CACHE.memoize(ITEM, models=("user_movie_matrix",))(item_based_recommender)
+item_based_recommender("Matrix, The (1999)", user_movie_matrix)
+item_based_recommender("Matrix, The (1999)", user_movie_matrix)
+user_movie_matrix = load_ratings_matrix(min_count=1000)
+item_based_recommender("Matrix, The (1999)", user_movie_matrix)
+RESULT_CACHE.stats()
+#              hits  misses  evictions  expirations  size  hit_rate
+# entry_point
+# item            1       2          0            0     2  0.333333
@@ -0,0 +1,119 @@
+######################################
+# Precomputed Item-Item Correlation Index
+######################################
+
+# Offline: every item-item Pearson correlation (over the users who rated both
+# movies, like corrwith) is computed from sparse co-rating sums, one block of
+# movies at a time, and only the top-k per movie is kept and persisted.
+# Online: item_based recommendations are an O(k) lookup.
+# Pairs with fewer than min_common co-raters are dropped and correlations are
+# shrunk towards 0 by n / (n + shrinkage), using the co-rating counts n from
+# the same sparse product, so the stored lists are already usable.
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from model_store import load_arrays, save_arrays
+from ratings_matrix import centre_ratings, pearson_from_sums
+from result_cache import ITEM, RESULT_CACHE
+from similarity_index import TopKIndex, pad_top_k, top_k_rows
+
+ITEM_INDEX_KIND = "item-similarity"
+
+
+class ItemCoRatingSums:
+    # stacked = [R, P, R^2] (CSC), so stacked^T @ [R_B, P_B, R^2_B] yields
+    # every co-rating sum of the movies in block B in one sparse product
+    # (R centred ratings, P rated-or-not)
+    def __init__(self, stacked):
+        self.stacked = sp.csc_matrix(stacked)
+        self.left = self.stacked.T  # CSR view of the same arrays
+        self.n_items = self.stacked.shape[1] // 3
+
+    @classmethod
+    def from_ratings(cls, matrix):
+        ratings = centre_ratings(matrix, axis=0)
+        present = ratings.copy()
+        present.data = np.ones_like(present.data)
+        squared = ratings.multiply(ratings).tocsc()
+        return cls(sp.hstack((ratings, present, squared), format="csc"))
+
+    def block(self, columns):
+        columns = np.asarray(columns)
+        right = self.stacked[:, np.concatenate([columns + i * self.n_items for i in range(3)])]
+        sums = (self.left @ right).toarray()
+        items, cols = self.n_items, len(columns)
+
+        def part(i, j):
+            return sums[i * items:(i + 1) * items, j * cols:(j + 1) * cols]
+
+        # rows: every movie x, columns: movies y of the block
+        return {"sum_xy": part(0, 0),
+                "sum_x": part(0, 1),
+                "sum_y": part(1, 0),
+                "n": part(1, 1),
+                "sum_xx": part(2, 1),
+                "sum_yy": part(1, 2)}
+
+
+def item_block_top_k(co_sums, columns, k=50, min_common=2, shrinkage=0):
+    # (neighbors, scores, supports) of the movies in columns, padded with -1 / 0
+    sums = co_sums.block(columns)
+    corr = pearson_from_sums(**sums).T
+    common = sums["n"].T
+    if shrinkage:
+        corr *= common / (common + shrinkage)
+    corr[np.isnan(corr) | (common < min_common)] = -np.inf
+    corr[np.arange(len(columns)), columns] = -np.inf
+    top = top_k_rows(corr, k)
+    neighbors, scores = pad_top_k(top, np.take_along_axis(corr, top, axis=1))
+    supports = np.where(neighbors >= 0, np.take_along_axis(common, top, axis=1), 0).astype(np.int32)
+    return neighbors, scores, supports
+
+
+def build_item_index(ratings, k=50, block_size=256, min_common=2, shrinkage=0):
+    # ratings: RatingsMatrix (users x movies)
+    co_sums = ItemCoRatingSums.from_ratings(ratings.matrix)
+    n_items = ratings.shape[1]
+    k = min(k, n_items - 1)
+    neighbors = np.full((n_items, k), -1, dtype=np.int32)
+    scores = np.zeros((n_items, k), dtype=np.float32)
+    supports = np.zeros((n_items, k), dtype=np.int32)
+
+    for start in range(0, n_items, block_size):
+        columns = np.arange(start, min(start + block_size, n_items))
+        neighbors[columns], scores[columns], supports[columns] = \
+            item_block_top_k(co_sums, columns, k, min_common, shrinkage)
+
+    return ItemNeighbors(ratings.titles, TopKIndex(neighbors, scores), supports,
+                         {"min_common": min_common, "shrinkage": shrinkage})
+
+
+class ItemNeighbors:
+    # supports[i] holds the number of users who rated both movie i and each
+    # of its neighbours
+    def __init__(self, titles, sim_index, supports=None, params=None):
+        self.titles = np.asarray(titles, dtype=object)
+        self.title_index = pd.Index(self.titles)
+        self.sim_index = sim_index
+        self.supports = supports
+        self.params = params or {}
+
+    def recommend(self, movie_name, rec_count=10):
+        neighbors, scores = self.sim_index.query(self.title_index.get_loc(movie_name), k=rec_count)
+        return pd.Series(scores.astype(np.float64), index=pd.Index(self.titles[neighbors], name="title"))
+
+    def save(self, path):
+        arrays = {"neighbors": self.sim_index.neighbors, "scores": self.sim_index.scores}
+        if self.supports is not None:
+            arrays["supports"] = self.supports
+        save_arrays(path, ITEM_INDEX_KIND, arrays,
+                    {"titles": self.titles.tolist(), "params": self.params})
+        RESULT_CACHE.invalidate(ITEM)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        arrays, meta = load_arrays(path, ITEM_INDEX_KIND, mmap=mmap)
+        RESULT_CACHE.invalidate(ITEM)
+        return cls(meta["titles"], TopKIndex(arrays["neighbors"], arrays["scores"]),
+                   arrays.get("supports"), meta.get("params"))
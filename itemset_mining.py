@@ -0,0 +1,68 @@
+############################################
+# Eclat Frequent Itemset Mining
+############################################
+
+# Vertical Eclat over bitset tidlists, directly on a BasketMatrix:
+# - every frequent product becomes a packed bitset of the invoices holding it
+# - an itemset is extended depth first, and the support of all extensions of
+#   a prefix is one vectorized AND + popcount over their bitsets
+# There is no apriori candidate generation and no dense one-hot frame. The
+# result has the same support / itemsets columns as mlxtend apriori, so it
+# can be passed to association_rules unchanged.
+
+import numpy as np
+import pandas as pd
+
+# number of set bits of every byte value
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int32)
+
+
+def popcount(bits):
+    # set bits per row of a uint64 bitset array
+    if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+        return np.bitwise_count(bits).sum(axis=1, dtype=np.int64)
+    return _POPCOUNT[bits.view(np.uint8)].sum(axis=1, dtype=np.int64)
+
+
+def tidset_bits(basket, items):
+    # (len(items), n_invoices / 64) uint64 bitsets of the given product columns
+    matrix = basket.matrix.tocsc()[:, items]
+    bits = np.zeros((len(items), (matrix.shape[0] + 63) // 64 * 8), dtype=np.uint8)
+    columns = np.repeat(np.arange(len(items)), np.diff(matrix.indptr))
+    rows = matrix.indices
+    np.bitwise_or.at(bits, (columns, rows >> 3), (1 << (rows & 7)).astype(np.uint8))
+    return bits.view(np.uint64)
+
+
+def _extend(prefix, items, bits, supports, n_invoices, min_support, max_len, found):
+    # items / bits / supports: the frequent one-item extensions of prefix
+    for i in range(len(items)):
+        itemset = prefix + (items[i],)
+        found.append((supports[i], itemset))
+        if max_len is not None and len(itemset) >= max_len:
+            continue
+        shared = bits[i + 1:] & bits[i]
+        support = popcount(shared) / float(n_invoices)
+        keep = support >= min_support
+        if keep.any():
+            _extend(itemset, items[i + 1:][keep], shared[keep], support[keep], n_invoices,
+                    min_support, max_len, found)
+
+
+def eclat(basket, min_support=0.5, use_colnames=False, max_len=None):
+    # Same itemsets and supports as apriori(basket.to_dataframe(), ...)
+    n_invoices = basket.shape[0]
+    support = basket.support()
+    frequent = np.flatnonzero(support >= min_support)
+    found = []
+    if len(frequent) and n_invoices:
+        _extend((), frequent, tidset_bits(basket, frequent), support[frequent], n_invoices,
+                min_support, max_len, found)
+
+    names = basket.items if use_colnames else np.arange(basket.shape[1])
+    frequent_itemsets = pd.DataFrame({"support": [support for support, _ in found],
+                                      "itemsets": [frozenset(names[list(itemset)]) for _, itemset in found]},
+                                     columns=["support", "itemsets"])
+    # ordered by itemset length like apriori
+    order = np.argsort([len(itemset) for _, itemset in found], kind="stable")
+    return frequent_itemsets.iloc[order].reset_index(drop=True)
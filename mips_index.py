@@ -0,0 +1,72 @@
+#############################################
+# Maximum Inner Product Index over Item Factors
+#############################################
+
+# Exact top-N serving for factor models (e.g. ImplicitALS):
+# - item factors are stored as contiguous float32 blocks, sorted by norm
+#   (largest first), optionally pre-normalized so scores become cosines
+# - a batch of user vectors is scored one item block at a time with one
+#   GEMM, and the running top-k is kept with argpartition
+# - q.y <= |q| |y|, so once |q| times the block's largest norm cannot beat
+#   any query's current k-th score the remaining blocks are skipped
+# - already rated items are excluded through the users' sparse rating rows,
+#   only the entries falling in the current block are set to -inf
+# so latency grows with the blocks actually scored, not with every item.
+
+import numpy as np
+import scipy.sparse as sp
+from similarity_index import pad_top_k, top_k_rows
+
+
+class FactorIndex:
+    def __init__(self, item_factors, block_size=8192, normalize=False):
+        factors = np.asarray(item_factors, dtype=np.float32)
+        norms = np.linalg.norm(factors, axis=1)
+        if normalize:
+            factors = factors / np.maximum(norms, 1e-12)[:, np.newaxis]
+            norms = np.linalg.norm(factors, axis=1)
+        # sorted position -> item, and item -> sorted position
+        self.order = np.argsort(-norms, kind="stable")
+        self.position = np.empty_like(self.order)
+        self.position[self.order] = np.arange(len(self.order))
+        self.factors = np.ascontiguousarray(factors[self.order])
+        self.norms = norms[self.order]
+        self.block_size = block_size
+        self.normalize = normalize
+
+    def __len__(self):
+        return len(self.factors)
+
+    def query(self, user_vectors, k=10, exclude=None):
+        # user_vectors: (n_queries, n_factors); exclude: sparse (n_queries, n_items)
+        # matrix whose stored entries are skipped, e.g. session.ratings[user_rows].
+        # Returns (items, scores), both (n_queries, k), best first, padded with -1 / 0
+        queries = np.atleast_2d(np.asarray(user_vectors, dtype=np.float32))
+        n_queries, n_items = len(queries), len(self.factors)
+        k = min(k, n_items)
+        best_scores = np.full((n_queries, k), -np.inf, dtype=np.float32)
+        best_positions = np.zeros((n_queries, k), dtype=np.int64)
+        query_norms = np.linalg.norm(queries, axis=1)
+
+        if exclude is not None:
+            excluded = sp.coo_matrix(exclude)
+            excluded_positions = self.position[excluded.col]
+            by_position = np.argsort(excluded_positions, kind="stable")
+            excluded_rows, excluded_positions = excluded.row[by_position], excluded_positions[by_position]
+
+        for lo in range(0, n_items, self.block_size):
+            if k == 0 or (query_norms * self.norms[lo] < best_scores[:, -1]).all():
+                break
+            hi = min(lo + self.block_size, n_items)
+            scores = queries @ self.factors[lo:hi].T
+            if exclude is not None:
+                start, stop = np.searchsorted(excluded_positions, [lo, hi])
+                scores[excluded_rows[start:stop], excluded_positions[start:stop] - lo] = -np.inf
+
+            merged = np.hstack([best_scores, scores])
+            top = top_k_rows(merged, k)
+            best_scores = np.take_along_axis(merged, top, axis=1)
+            positions = np.hstack([best_positions, np.broadcast_to(np.arange(lo, hi), (n_queries, hi - lo))])
+            best_positions = np.take_along_axis(positions, top, axis=1)
+
+        return pad_top_k(self.order[best_positions], best_scores)
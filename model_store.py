@@ -0,0 +1,76 @@
+#############################
+# Versioned On-Disk Model Store
+#############################
+
+# A model is a directory with one .npy file per array and a meta.json that
+# records the model kind, the format version and any small JSON metadata.
+# Plain .npy files can be opened with np.load(mmap_mode='r'), so several
+# worker processes share one page-cached copy and loading is near-instant.
+# The path itself is a symlink to the current version directory
+# (.<name>.<timestamp> next to it), so a save can swap models atomically.
+# A load resolves the symlink once and reads every file from that version;
+# the previous version is kept until the next save, so a load that started
+# before a swap still finishes on the version it began with.
+
+import json
+import os
+import re
+import shutil
+import time
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def save_arrays(path, kind, arrays, meta=None):
+    # Written to a new version directory first, then the symlink is switched
+    # over with one rename, so readers always find a complete model: the old
+    # one or the new one
+    path = path.rstrip(os.sep)
+    parent, name = os.path.split(path)
+    version = f".{name}.{time.time_ns()}"
+    version_path = os.path.join(parent, version)
+    os.makedirs(version_path)
+    for array_name, array in arrays.items():
+        np.save(os.path.join(version_path, array_name + ".npy"), np.asarray(array), allow_pickle=False)
+    with open(os.path.join(version_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"kind": kind,
+                   "version": FORMAT_VERSION,
+                   "arrays": sorted(arrays),
+                   "meta": meta or {}}, f, ensure_ascii=False)
+
+    previous = None
+    if os.path.islink(path):
+        previous = os.readlink(path)
+    elif os.path.isdir(path):
+        # plain directory from an older save: moved aside like a version
+        previous = version + ".old"
+        os.rename(path, os.path.join(parent, previous))
+    link_path = version_path + ".link"
+    os.symlink(version, link_path)
+    os.replace(link_path, path)
+    # the current and the previous version are kept, older ones removed
+    pattern = re.compile(re.escape(f".{name}.") + r"\d+(\.old|\.link)?")
+    for entry in os.listdir(parent or "."):
+        if entry not in (version, previous) and pattern.fullmatch(entry):
+            entry_path = os.path.join(parent, entry)
+            if os.path.islink(entry_path):
+                os.remove(entry_path)
+            else:
+                shutil.rmtree(entry_path, ignore_errors=True)
+
+
+def load_arrays(path, kind, mmap=True):
+    version_path = os.path.realpath(path)
+    with open(os.path.join(version_path, "meta.json"), encoding="utf-8") as f:
+        header = json.load(f)
+    if header.get("kind") != kind:
+        raise ValueError(f"{path} holds a {header.get('kind')!r} model, expected {kind!r}")
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path} has format version {header.get('version')}, "
+                         f"expected {FORMAT_VERSION}; rebuild the model")
+    mmap_mode = "r" if mmap else None
+    arrays = {name: np.load(os.path.join(version_path, name + ".npy"), mmap_mode=mmap_mode,
+                            allow_pickle=False)
+              for name in header["arrays"]}
+    return arrays, header["meta"]
@@ -0,0 +1,200 @@
+######################################
+# Sparse User x Movie Ratings Matrix
+######################################
+
+# Replaces the dense NaN-filled pivot_table with a scipy.sparse CSR matrix:
+# rows are integer-coded users, columns integer-coded movie titles (the same
+# axes as user_movie_df), plus the maps between ids and positions.
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from data_loader import MOVIE_PATH, RATING_PATH, load_movies, load_ratings
+
+
+class RatingsMatrix:
+    def __init__(self, matrix, user_ids, titles):
+        self.matrix = sp.csr_matrix(matrix)
+        self.user_ids = np.asarray(user_ids)
+        self.titles = np.asarray(titles, dtype=object)
+        self.user_index = pd.Index(self.user_ids)
+        self.title_index = pd.Index(self.titles)
+        self._csc = None
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def csc(self):
+        # column-major copy for fast per-movie access, built on first use
+        if self._csc is None:
+            self._csc = self.matrix.tocsc()
+        return self._csc
+
+    def user_pos(self, user_id):
+        return self.user_index.get_loc(user_id)
+
+    def movie_pos(self, title):
+        return self.title_index.get_loc(title)
+
+    def user_ratings(self, user_pos):
+        # (movie positions, ratings) of one user
+        lo, hi = self.matrix.indptr[user_pos], self.matrix.indptr[user_pos + 1]
+        return self.matrix.indices[lo:hi], self.matrix.data[lo:hi]
+
+    def movie_ratings(self, movie_pos):
+        # (user positions, ratings) of one movie
+        lo, hi = self.csc.indptr[movie_pos], self.csc.indptr[movie_pos + 1]
+        return self.csc.indices[lo:hi], self.csc.data[lo:hi]
+
+    def with_ratings(self, user_ids, titles, ratings):
+        # (updated RatingsMatrix, positions of the users whose row changed).
+        # A new rating replaces the user's earlier rating of the title, unknown
+        # users are appended (so existing positions stay valid) and titles
+        # outside the matrix are ignored.
+        title_pos = self.title_index.get_indexer(pd.Index(titles))
+        known = title_pos >= 0
+        user_ids = np.asarray(user_ids)[known]
+        title_pos = title_pos[known]
+        ratings = np.asarray(ratings, dtype=self.matrix.dtype)[known]
+
+        new_users = pd.unique(user_ids[self.user_index.get_indexer(user_ids) < 0])
+        all_user_ids = np.concatenate([self.user_ids, new_users]).astype(self.user_ids.dtype)
+        user_pos = pd.Index(all_user_ids).get_indexer(user_ids)
+        shape = (len(all_user_ids), len(self.titles))
+
+        old = self.matrix.tocoo()
+        rows = np.concatenate([old.row, user_pos])
+        cols = np.concatenate([old.col, title_pos])
+        data = np.concatenate([old.data, ratings])
+        # the last rating of every (user, title) pair wins
+        keys = rows.astype(np.int64) * shape[1] + cols
+        _, last = np.unique(keys[::-1], return_index=True)
+        keep = len(keys) - 1 - last
+        matrix = sp.csr_matrix((data[keep], (rows[keep], cols[keep])), shape=shape)
+        return RatingsMatrix(matrix, all_user_ids, self.titles), np.unique(user_pos)
+
+    def to_dataframe(self, user_positions=None, movie_positions=None):
+        # Dense NaN-filled user_movie_df view, only meant for small blocks
+        block = self.matrix
+        users, titles = self.user_ids, self.titles
+        if user_positions is not None:
+            block, users = block[user_positions], users[user_positions]
+        if movie_positions is not None:
+            block, titles = block[:, movie_positions], titles[movie_positions]
+        dense = np.full(block.shape, np.nan)
+        coo = block.tocoo()
+        dense[coo.row, coo.col] = coo.data
+        return pd.DataFrame(dense, index=pd.Index(users, name="userId"),
+                            columns=pd.Index(titles, name="title"))
+
+
+def _assemble_ratings_matrix(users, title_parts, ratings, titles, title_counts, min_count):
+    # RatingsMatrix from parts (e.g. one per chunk) of user ids, title codes
+    # into titles and ratings; title_counts holds the ratings per title.
+    # movies with <= min_count ratings are rare, like comment_counts in create_user_movie_df
+    kept = title_counts > min_count
+    new_code = (np.cumsum(kept) - 1).astype(np.int32)
+    # filtered part by part, so each unfiltered part is freed as it goes
+    for i, title_part in enumerate(title_parts):
+        keep = kept[title_part]
+        users[i], title_parts[i], ratings[i] = users[i][keep], new_code[title_part[keep]], ratings[i][keep]
+
+    user_ids, user_codes = np.unique(np.concatenate(users), return_inverse=True)
+    title_codes = np.concatenate(title_parts)
+    shape = (len(user_ids), int(kept.sum()))
+    # a user rating two movies with the same title gets the mean, like pivot_table
+    sums = sp.csr_matrix((np.concatenate(ratings).astype(np.float64), (user_codes, title_codes)), shape=shape)
+    n_ratings = sp.csr_matrix((np.ones(len(title_codes)), (user_codes, title_codes)), shape=shape)
+    sums.data /= n_ratings.data
+    return RatingsMatrix(sums.astype(np.float32), user_ids, titles[kept])
+
+
+def build_ratings_matrix(movie, rating, min_count=1000):
+    df = rating[["userId", "movieId", "rating"]].merge(movie[["movieId", "title"]], on="movieId")
+    title_codes, titles = pd.factorize(df["title"], sort=True)
+    return _assemble_ratings_matrix([df["userId"].to_numpy()], [title_codes.astype(np.int32)],
+                                    [df["rating"].to_numpy(np.float64)], titles.to_numpy(),
+                                    np.bincount(title_codes, minlength=len(titles)), min_count)
+
+
+def load_ratings_matrix(movie_path=MOVIE_PATH, rating_path=RATING_PATH, min_count=1000, chunksize=None):
+    # chunksize: stream rating.csv in chunks of that many rows instead of
+    # loading it whole (for ratings files that do not fit in memory)
+    if chunksize is not None:
+        return stream_ratings_matrix(movie_path, rating_path, min_count, chunksize)
+    return build_ratings_matrix(load_movies(movie_path), load_ratings(rating_path), min_count)
+
+
+def stream_ratings_matrix(movie_path=MOVIE_PATH, rating_path=RATING_PATH, min_count=1000,
+                          chunksize=1_000_000):
+    # Same RatingsMatrix as build_ratings_matrix, without ever holding the
+    # rating frame or the merged frame: every chunk is reduced to int32 user
+    # ids, int32 title codes and float32 ratings while the per-title counts
+    # are kept as a running total, so the rare-title cut only needs the
+    # counts at the end.
+    movie = load_movies(movie_path)
+    title_codes, titles = pd.factorize(movie["title"], sort=True)
+    # movieId -> title code, -1 for unknown movies (dropped like the inner merge)
+    movie_title = np.full(int(movie["movieId"].max()) + 1, -1, dtype=np.int32)
+    movie_title[movie["movieId"].to_numpy()] = title_codes
+
+    title_counts = np.zeros(len(titles), dtype=np.int64)
+    users, title_parts, ratings = [], [], []
+    for chunk in pd.read_csv(rating_path, usecols=["userId", "movieId", "rating"], chunksize=chunksize,
+                             dtype={"userId": np.int32, "movieId": np.int32, "rating": np.float32}):
+        movie_ids = chunk["movieId"].to_numpy()
+        known = movie_ids < len(movie_title)
+        codes = np.full(len(movie_ids), -1, dtype=np.int32)
+        codes[known] = movie_title[movie_ids[known]]
+        known = codes >= 0
+        title_counts += np.bincount(codes[known], minlength=len(titles))
+        users.append(chunk["userId"].to_numpy()[known])
+        title_parts.append(codes[known])
+        ratings.append(chunk["rating"].to_numpy()[known])
+
+    return _assemble_ratings_matrix(users, title_parts, ratings, titles, title_counts, min_count)
+
+
+def centre_ratings(matrix, axis=0):
+    # Subtracts every movie's (axis=0) or user's (axis=1) mean from its stored
+    # ratings. Pearson is unchanged by such shifts, and centred sums lose less
+    # float precision. Ratings equal to the mean stay stored as explicit zeros.
+    matrix = (sp.csc_matrix if axis == 0 else sp.csr_matrix)(matrix, dtype=np.float64, copy=True)
+    counts = np.diff(matrix.indptr)
+    sums = np.bincount(np.repeat(np.arange(len(counts)), counts), weights=matrix.data,
+                       minlength=len(counts))
+    matrix.data -= np.repeat(sums / np.maximum(counts, 1), counts)
+    return matrix
+
+
+def pearson_with(matrix, rows, values):
+    # Pearson correlation of a target vector (values at the given rows) with
+    # every column of matrix, using only the rows where both are present -
+    # the same pairwise-complete result as DataFrame.corrwith, in one pass.
+    sub = sp.csr_matrix(matrix)[rows].astype(np.float64)
+    present = sub.copy()
+    present.data = np.ones_like(present.data)
+    x = np.asarray(values, dtype=np.float64)
+
+    n = np.asarray(present.sum(axis=0)).ravel()
+    sum_y = np.asarray(sub.sum(axis=0)).ravel()
+    sum_yy = np.asarray(sub.multiply(sub).sum(axis=0)).ravel()
+    sum_x = present.T @ x
+    sum_xx = present.T @ (x * x)
+    sum_xy = sub.T @ x
+    return pearson_from_sums(sum_xy, sum_x, sum_y, n, sum_xx, sum_yy)
+
+
+def pearson_from_sums(sum_xy, sum_x, sum_y, n, sum_xx, sum_yy):
+    # Pearson correlation from co-rating sums (n: number of co-rated entries)
+    cov = n * sum_xy - sum_x * sum_y
+    var_x = n * sum_xx - sum_x ** 2
+    var_y = n * sum_yy - sum_y ** 2
+    # constant vectors (zero variance up to rounding) have no correlation
+    constant = (var_x <= 1e-9 * n * sum_xx) | (var_y <= 1e-9 * n * sum_yy)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cov / np.sqrt(var_x * var_y)
+    corr[constant | (n < 2)] = np.nan
+    return np.clip(corr, -1.0, 1.0)
@@ -0,0 +1,128 @@
+#############################################
+# In-Process Recommendation Result Cache
+#############################################
+
+# Popular titles and products are requested over and over, so results of
+# the recommender entry points are cached in memory:
+# - keyed by entry point, query and every parameter (rec_count, cor_th,
+#   score, ratio, ...); model / index arguments enter the key through a
+#   version number given to every model object, never reused, so another
+#   model never answers from this one's results
+# - bounded by size (least recently used entries are evicted first) and by
+#   age (entries older than ttl seconds are recomputed)
+# - hit / miss / eviction / expiration counters per entry point
+# - invalidate(entry_point) drops an entry point's results; the methods that
+#   rebuild or update a model in place call it for their entry point
+# RESULT_CACHE is shared by every entry point of the process.
+
+import functools
+import inspect
+import itertools
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+
+# entry points of the four recommenders
+CONTENT, ITEM, USER, ARL = "content", "item", "user", "arl"
+
+_COUNTERS = ("hits", "misses", "evictions", "expirations")
+_versions = itertools.count(1)
+
+
+def model_version(model):
+    # process-unique version of a model object, assigned on first use
+    version = getattr(model, "_cache_version", None)
+    if version is None:
+        version = model._cache_version = next(_versions)
+    return version
+
+
+class ResultCache:
+    def __init__(self, max_size=10000, ttl=600, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _count(self, entry_point, counter):
+        counters = self._counters.setdefault(entry_point, dict.fromkeys(_COUNTERS, 0))
+        counters[counter] += 1
+
+    def get(self, entry_point, key):
+        # (True, value) on a hit, (False, None) otherwise
+        with self._lock:
+            entry = self._entries.get((entry_point, key))
+            if entry is not None and entry[0] <= self.clock():
+                del self._entries[(entry_point, key)]
+                self._count(entry_point, "expirations")
+                entry = None
+            if entry is None:
+                self._count(entry_point, "misses")
+                return False, None
+            self._entries.move_to_end((entry_point, key))
+            self._count(entry_point, "hits")
+            return True, _copy(entry[1])
+
+    def put(self, entry_point, key, value):
+        with self._lock:
+            self._entries[(entry_point, key)] = (self.clock() + self.ttl, _copy(value))
+            self._entries.move_to_end((entry_point, key))
+            while len(self._entries) > self.max_size:
+                (evicted_entry_point, _), _ = self._entries.popitem(last=False)
+                self._count(evicted_entry_point, "evictions")
+
+    def invalidate(self, entry_point=None):
+        # drops the results of one entry point, or of all of them
+        with self._lock:
+            if entry_point is None:
+                self._entries.clear()
+            else:
+                for key in [key for key in self._entries if key[0] == entry_point]:
+                    del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            stats = pd.DataFrame.from_dict(self._counters, orient="index",
+                                           columns=list(_COUNTERS)).rename_axis("entry_point")
+            stats["size"] = [sum(key[0] == entry_point for key in self._entries) for entry_point in stats.index]
+        requests = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / requests.where(requests > 0)
+        return stats
+
+    def memoize(self, entry_point, models=()):
+        # Decorator caching function results under entry_point; the arguments
+        # named in models (model / index objects) are keyed by model_version
+        def decorator(function):
+            signature = inspect.signature(function)
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                key = tuple((name, model_version(value) if name in models else value)
+                            for name, value in bound.arguments.items())
+                hit, value = self.get(entry_point, key)
+                if hit:
+                    return value
+                value = function(*args, **kwargs)
+                self.put(entry_point, key, value)
+                return value
+
+            wrapper.invalidate = lambda: self.invalidate(entry_point)
+            return wrapper
+        return decorator
+
+
+def _copy(value):
+    # results are frames / series / lists; callers get their own copy so
+    # changing a result never changes the cached one
+    return value.copy() if hasattr(value, "copy") else value
+
+
+RESULT_CACHE = ResultCache()
@@ -0,0 +1,43 @@
+############################################
+# Online Retail Data Preparation
+############################################
+
+# retail_data_prep in one pass: the missing-value, cancelled-invoice,
+# Quantity > 0 and Price > 0 conditions are combined into one boolean mask
+# and the frame is copied once, instead of once per filter. The quantiles of
+# Quantity and Price are computed in one call and both columns are capped
+# with np.clip. Dtypes are shrunk on the way: Customer ID becomes int32 and
+# the capped Quantity float32. Price keeps float64 so prices are not rounded.
+
+import numpy as np
+from data_loader import shrink_dtypes
+
+
+def outlier_thresholds(dataframe, variables, low_quantile=0.01, up_quantile=0.99):
+    # (low_limit, up_limit): scalars for one column, Series for a list of columns
+    quartiles = dataframe[variables].quantile([low_quantile, up_quantile])
+    quartile1, quartile3 = quartiles.iloc[0], quartiles.iloc[1]
+    interquantile_range = quartile3 - quartile1
+    up_limit = quartile3 + 1.5 * interquantile_range
+    low_limit = quartile1 - 1.5 * interquantile_range
+    return low_limit, up_limit
+
+
+def replace_with_thresholds(dataframe, variables):
+    variables = [variables] if isinstance(variables, str) else list(variables)
+    low_limit, up_limit = outlier_thresholds(dataframe, variables)
+    for variable in variables:
+        dataframe[variable] = np.clip(dataframe[variable].to_numpy(np.float64),
+                                      low_limit[variable], up_limit[variable])
+
+
+def retail_data_prep(dataframe):
+    keep = np.ones(len(dataframe), dtype=bool)
+    for _, column in dataframe.items():
+        keep &= column.notna().to_numpy()
+    keep &= ~dataframe["Invoice"].astype(str).str.contains("C", regex=False).to_numpy()
+    keep &= (dataframe["Quantity"] > 0).to_numpy() & (dataframe["Price"] > 0).to_numpy()
+    dataframe = dataframe.loc[keep]
+
+    replace_with_thresholds(dataframe, ["Quantity", "Price"])
+    return shrink_dtypes(dataframe, int32=["Customer ID"], float32=["Quantity"], categories=["Country"])
@@ -0,0 +1,39 @@
+############################################
+# Antecedent-Keyed Rule Index
+############################################
+
+# arl_recommender sorted the whole rules frame by lift on every call and
+# scanned every antecedent itemset with iloc row access inside the loop.
+# RuleIndex does that scan once: every product of an antecedent (single or
+# multi-item) maps to the consequents of its rules, sorted by lift, so a
+# recommendation is a dict lookup plus a slice of rec_count items.
+
+import numpy as np
+
+
+class RuleIndex:
+    def __init__(self, rules):
+        # same order and same consequent per rule as the original loop:
+        # rules by descending lift, the first item of each consequent set
+        sorted_rules = rules.sort_values("lift", ascending=False)
+        consequents, lifts = {}, {}
+        for antecedent_set, consequent_set, lift in zip(sorted_rules["antecedents"],
+                                                        sorted_rules["consequents"],
+                                                        sorted_rules["lift"]):
+            consequent = list(consequent_set)[0]
+            for product in antecedent_set:
+                consequents.setdefault(product, []).append(consequent)
+                lifts.setdefault(product, []).append(lift)
+        self.consequents = {product: np.array(items, dtype=object) for product, items in consequents.items()}
+        self.lifts = {product: np.array(values) for product, values in lifts.items()}
+
+    def __contains__(self, product_id):
+        return product_id in self.consequents
+
+    def __len__(self):
+        return len(self.consequents)
+
+    def recommend(self, product_id, rec_count=1):
+        if product_id not in self.consequents:
+            return []
+        return self.consequents[product_id][:rec_count].tolist()
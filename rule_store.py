@@ -0,0 +1,136 @@
+############################################
+# Per-Country Association Rule Store
+############################################
+
+# python rule_store.py
+# Mines the association rules of every Country of the Online Retail data,
+# one country per process, and writes each rule set to an on-disk store:
+#   models/rules/<country>/<parameters>/
+# Serving processes load the prebuilt rules instead of re-mining at startup.
+# Antecedents / consequents are stored as item codes plus offsets, the rule
+# metrics as float arrays and the products (StockCode or Description) in
+# meta.json, so loading needs no pickle.
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from mlxtend.frequent_patterns import association_rules
+from basket_matrix import build_basket_matrix
+from itemset_mining import eclat
+from model_store import load_arrays, save_arrays
+from result_cache import ARL, RESULT_CACHE
+
+RULES_KIND = "association-rules"
+RULES_DIR = "models/rules"
+
+
+def mine_rules(dataframe, id=True, min_support=0.01, metric="support", min_threshold=0.01):
+    # create_rules for rows of one country
+    frequent_itemsets = eclat(build_basket_matrix(dataframe, id), min_support=min_support,
+                              use_colnames=True)
+    if frequent_itemsets.empty:
+        return pd.DataFrame(columns=["antecedents", "consequents"])
+    return association_rules(frequent_itemsets, metric=metric, min_threshold=min_threshold)
+
+
+def _plain(value):
+    # numpy scalars -> python values for meta.json
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class RuleStore:
+    def __init__(self, root=RULES_DIR):
+        self.root = root
+
+    @staticmethod
+    def params(id=True, min_support=0.01, metric="support", min_threshold=0.01):
+        return {"id": bool(id), "min_support": float(min_support), "metric": metric,
+                "min_threshold": float(min_threshold)}
+
+    def path(self, country, **params):
+        params = self.params(**params)
+        key = "_".join(f"{name}={value}" for name, value in params.items())
+        return os.path.join(self.root, re.sub(r"[^0-9A-Za-z]+", "_", country), key)
+
+    def has(self, country, **params):
+        return os.path.exists(os.path.join(self.path(country, **params), "meta.json"))
+
+    def countries(self):
+        found = []
+        for name in sorted(os.listdir(self.root)) if os.path.isdir(self.root) else []:
+            for key in os.listdir(os.path.join(self.root, name)):
+                if key.startswith("."):
+                    # model_store version directories
+                    continue
+                try:
+                    _, meta = load_arrays(os.path.join(self.root, name, key), RULES_KIND, mmap=False)
+                except (OSError, ValueError):
+                    continue
+                found.append({"country": meta["country"], **meta["params"]})
+        return pd.DataFrame(found)
+
+    def save(self, country, rules, **params):
+        codes, arrays = {}, {}
+        for side in ("antecedents", "consequents"):
+            itemsets = rules[side].tolist()
+            flat = [codes.setdefault(item, len(codes))
+                    for itemset in itemsets for item in sorted(itemset, key=str)]
+            arrays[side + "_items"] = np.array(flat, dtype=np.int32)
+            arrays[side + "_offsets"] = np.cumsum([0] + [len(itemset) for itemset in itemsets], dtype=np.int64)
+        items = [_plain(item) for item in codes]
+        metrics = [column for column in rules.columns if column not in ("antecedents", "consequents")]
+        for i, column in enumerate(metrics):
+            arrays[f"metric_{i}"] = rules[column].to_numpy(np.float64)
+        save_arrays(self.path(country, **params), RULES_KIND, arrays,
+                    {"country": country, "params": self.params(**params), "items": items,
+                     "metrics": metrics})
+        RESULT_CACHE.invalidate(ARL)
+
+    def load(self, country, **params):
+        arrays, meta = load_arrays(self.path(country, **params), RULES_KIND, mmap=False)
+        items = np.empty(len(meta["items"]), dtype=object)
+        items[:] = meta["items"]
+        rules = {}
+        for side in ("antecedents", "consequents"):
+            codes, offsets = arrays[side + "_items"], arrays[side + "_offsets"]
+            rules[side] = [frozenset(items[codes[lo:hi]]) for lo, hi in zip(offsets[:-1], offsets[1:])]
+        for i, column in enumerate(meta["metrics"]):
+            rules[column] = arrays[f"metric_{i}"]
+        return pd.DataFrame(rules, columns=["antecedents", "consequents"] + meta["metrics"])
+
+    def load_or_mine(self, dataframe, country, **params):
+        # prebuilt rules when they exist, otherwise mined now and stored
+        if not self.has(country, **params):
+            self.save(country, mine_rules(dataframe[dataframe["Country"] == country], **params), **params)
+        return self.load(country, **params)
+
+
+def _mine_country(root, country, dataframe, params):
+    rules = mine_rules(dataframe, **params)
+    RuleStore(root).save(country, rules, **params)
+    return country, len(rules)
+
+
+def mine_all_countries(dataframe, store=None, countries=None, n_jobs=None, overwrite=False, **params):
+    # Mines every country (largest first, so the slowest start early) across
+    # processes; each worker only receives its own country's rows.
+    # Returns {country: number of rules}
+    store = store or RuleStore()
+    countries = countries or dataframe["Country"].value_counts().index.tolist()
+    todo = [country for country in countries if overwrite or not store.has(country, **params)]
+    groups = dict(tuple(dataframe[dataframe["Country"].isin(todo)].groupby("Country", observed=True)))
+    with ProcessPoolExecutor(max_workers=n_jobs or os.cpu_count()) as pool:
+        futures = [pool.submit(_mine_country, store.root, country, groups[country], store.params(**params))
+                   for country in todo if country in groups]
+        return dict(future.result() for future in futures)
+
+
+if __name__ == "__main__":
+    from data_loader import load_online_retail
+    from retail_prep import retail_data_prep
+
+    df = retail_data_prep(load_online_retail())
+    for country, n_rules in mine_all_countries(df).items():
+        print(f"{country}: {n_rules} rules")
@@ -0,0 +1,129 @@
+#############################
+# Top-k Similarity Index
+#############################
+
+# Keeps only the k most similar items of every row instead of the dense
+# N x N cosine similarity matrix. Similarities are computed block by block,
+# so peak memory is about block_size x N scores instead of N x N.
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+
+
+class TopKIndex:
+    # neighbors[i] holds the item indices most similar to item i (best first),
+    # scores[i] the matching cosine similarities. Rows with fewer than k
+    # neighbours are padded with -1 / 0.
+    def __init__(self, neighbors, scores):
+        self.neighbors = neighbors
+        self.scores = scores
+
+    def __len__(self):
+        return self.neighbors.shape[0]
+
+    @property
+    def k(self):
+        return self.neighbors.shape[1]
+
+    def query(self, item_index, k=None):
+        k = self.k if k is None else min(k, self.k)
+        neighbors = self.neighbors[item_index, :k]
+        scores = self.scores[item_index, :k]
+        mask = neighbors >= 0
+        return neighbors[mask], scores[mask]
+
+    def to_csr(self):
+        # Sparse N x N view of the index (row i -> its k neighbours)
+        mask = self.neighbors >= 0
+        indptr = np.concatenate([[0], np.cumsum(mask.sum(axis=1))])
+        return sp.csr_matrix((self.scores[mask], self.neighbors[mask], indptr),
+                             shape=(len(self), len(self)))
+
+
+def top_k_rows(block, k):
+    # Column indices of the k largest values of every row, best first
+    k = min(k, block.shape[1])
+    if k == 0:
+        return np.empty((block.shape[0], 0), dtype=np.int64)
+    part = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(block, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+
+def pad_top_k(neighbors, scores):
+    # -inf scores mark missing neighbours, padded with -1 / 0 as in TopKIndex
+    missing = np.isneginf(scores)
+    return (np.where(missing, -1, neighbors).astype(np.int32),
+            np.where(missing, 0, scores).astype(np.float32))
+
+
+def merge_top_k(neighbors, scores, rows, new_neighbors, new_scores):
+    # Merges the candidates new_neighbors into the top-k lists of rows, in
+    # place. new_scores is len(rows) x len(new_neighbors), -inf where a
+    # candidate does not qualify; only rows where a candidate beats the
+    # current k-th score are touched.
+    current = np.where(neighbors[rows] >= 0, scores[rows], -np.inf)
+    improved = np.flatnonzero((new_scores > current[:, -1:]).any(axis=1))
+    if not len(improved):
+        return
+    candidates = np.hstack([neighbors[rows[improved]],
+                            np.broadcast_to(new_neighbors, (len(improved), len(new_neighbors)))])
+    candidate_scores = np.hstack([current[improved], new_scores[improved]])
+    top = top_k_rows(candidate_scores, neighbors.shape[1])
+    neighbors[rows[improved]], scores[rows[improved]] = \
+        pad_top_k(np.take_along_axis(candidates, top, axis=1), np.take_along_axis(candidate_scores, top, axis=1))
+
+
+def top_k(scores, k, exclude=None):
+    # Positions of the k largest scores (best first) with partial selection
+    # instead of a full sort. NaN scores and the excluded positions (usually
+    # the query item itself) are never returned.
+    scores = np.array(scores, dtype=np.float64)
+    scores[np.isnan(scores)] = -np.inf
+    if exclude is not None:
+        scores[exclude] = -np.inf
+    top = top_k_rows(scores[np.newaxis, :], k)[0]
+    return top[scores[top] > -np.inf]
+
+
+def prepare_matrix(matrix):
+    # L2-normalized float32 CSR rows, so a dot product is the cosine similarity
+    return normalize(sp.csr_matrix(matrix, dtype=np.float32), norm="l2")
+
+
+def query_topk(matrix, query_rows, k=10, block_size=1024, exclude_self=True, normalized=False,
+               matrix_t=None):
+    # Top-k neighbours of the given rows against every row of matrix, with one
+    # sparse product per block of query rows instead of a Python loop.
+    # matrix_t: the normalized matrix transposed to CSR, built here once when
+    # not given (a CSC right-hand side would be converted on every product)
+    if not normalized:
+        matrix = prepare_matrix(matrix)
+        matrix_t = None
+    if matrix_t is None:
+        matrix_t = matrix.T.tocsr()
+    query_rows = np.asarray(query_rows, dtype=np.int64)
+    n_items = matrix.shape[0]
+    k = max(0, min(k, n_items - 1 if exclude_self else n_items))
+
+    neighbors = np.full((len(query_rows), k), -1, dtype=np.int32)
+    scores = np.zeros((len(query_rows), k), dtype=np.float32)
+
+    for start in range(0, len(query_rows), block_size):
+        rows = query_rows[start:start + block_size]
+        block = (matrix[rows] @ matrix_t).toarray()
+        if exclude_self:
+            block[np.arange(len(rows)), rows] = -np.inf
+        top = top_k_rows(block, k)
+        neighbors[start:start + len(rows)] = top
+        scores[start:start + len(rows)] = np.take_along_axis(block, top, axis=1)
+
+    return neighbors, scores
+
+
+def build_topk_index(matrix, k=10, block_size=1024, exclude_self=True):
+    matrix = prepare_matrix(matrix)
+    neighbors, scores = query_topk(matrix, np.arange(matrix.shape[0]), k=k, block_size=block_size,
+                                   exclude_self=exclude_self, normalized=True)
+    return TopKIndex(neighbors, scores)
@@ -9,21 +9,18 @@ import pandas as pd
 pd.set_option('display.max_columns', None)
 pd.set_option('display.width', 500)
 pd.set_option('display.expand_frame_repr', False)
+import numpy as np
+from ratings_matrix import load_ratings_matrix, pearson_with
+from data_loader import load_movies, load_ratings
 
 def create_user_movie_df():
-    import pandas as pd
-    movie = pd.read_csv('datasets/movie_lens_dataset/movie.csv')
-    rating = pd.read_csv('datasets/movie_lens_dataset/rating.csv')
-    df = movie.merge(rating, how="left", on="movieId")
-    comment_counts = pd.DataFrame(df["title"].value_counts())
-    rare_movies = comment_counts[comment_counts["count"] <= 1000].index
-    common_movies = df[~df["title"].isin(rare_movies)]
-    user_movie_df = common_movies.pivot_table(index=["userId"], columns=["title"], values="rating")
-    return user_movie_df
+    # Sparse CSR user x movie matrix (integer-coded axes + id maps) instead of
+    # the dense NaN-filled pivot_table; movies with <= 1000 ratings are dropped
+    return load_ratings_matrix(min_count=1000)
 
-user_movie_df = create_user_movie_df()
+user_movie_matrix = create_user_movie_df()
 
-random_user = int(pd.Series(user_movie_df.index).sample(1, random_state=45).values[0])
+random_user = int(pd.Series(user_movie_matrix.user_ids).sample(1, random_state=45).values[0])
 
 
 #############################################
@@ -31,12 +28,14 @@ random_user = int(pd.Series(user_movie_df.index).sample(1, random_state=45).valu
 #############################################
 random_user
 # 41531
-random_user_df = user_movie_df[user_movie_df.index == random_user]
+random_user_pos = user_movie_matrix.user_pos(random_user)
 
-movies_watched = random_user_df.columns[random_user_df.notna().any()].tolist()
+watched_pos, watched_ratings = user_movie_matrix.user_ratings(random_user_pos)
 
-user_movie_df.loc[user_movie_df.index == random_user,
-                  user_movie_df.columns == "Silence of the Lambs, The (1991)"]
+movies_watched = user_movie_matrix.titles[watched_pos].tolist()
+
+user_movie_matrix.to_dataframe([random_user_pos],
+                               [user_movie_matrix.movie_pos("Silence of the Lambs, The (1991)")])
 # title	Silence of the Lambs, The (1991)
 # userId
 # 41531.0	4.5
@@ -49,13 +48,11 @@ len(movies_watched)
 # Step 3: Accessing the Data and IDs of Other Users Watching the Same Movies
 #############################################
 
-movies_watched_df = user_movie_df[movies_watched]
-
-user_movie_count = movies_watched_df.T.notnull().sum()
-
-user_movie_count = user_movie_count.reset_index()
+movies_watched_matrix = user_movie_matrix.matrix[:, watched_pos].tocsr()
 
-user_movie_count.columns = ["userId", "movie_count"]
+# number of the watched movies every user has rated
+user_movie_count = pd.DataFrame({"userId": user_movie_matrix.user_ids,
+                                 "movie_count": np.diff(movies_watched_matrix.indptr)})
 
 user_movie_count[user_movie_count["movie_count"] > 20].sort_values("movie_count", ascending=False)
 # 	userId	movie_count
@@ -79,31 +76,26 @@ users_same_movies = user_movie_count[user_movie_count["movie_count"] > 20]["user
 #############################################
 
 # For this we will perform 3 steps:
-# We will aggregate the data of user 1 and other users.
-# 2. We will create the correlation df.
+# 1. We will take the ratings of the other users for the movies the user watched.
+# 2. We will correlate the user with each of them.
 # 3. We will find the most similar users (Top Users)
 
 
-final_df = pd.concat([movies_watched_df[movies_watched_df.index.isin(users_same_movies)],
-                      random_user_df[movies_watched]])
-
-corr_df = final_df.T.corr().unstack().sort_values().drop_duplicates()
-
-corr_df = pd.DataFrame(corr_df, columns=["corr"])
+same_movies_pos = user_movie_matrix.user_index.get_indexer(users_same_movies)
+same_movies_pos = same_movies_pos[same_movies_pos != random_user_pos]
 
-corr_df.index.names = ['user_id_1', 'user_id_2']
+# Only the target user's ratings are correlated against the other users, over
+# the watched movies, in one vectorized operation. final_df.T.corr() built the
+# full user x user matrix and drop_duplicates() on the values could drop real
+# neighbours with equal correlations.
+corr = pearson_with(movies_watched_matrix[same_movies_pos].T, np.arange(len(watched_pos)), watched_ratings)
 
-corr_df = corr_df.reset_index()
+corr_df = pd.DataFrame({"userId": user_movie_matrix.user_ids[same_movies_pos], "corr": corr})
 
-top_users = corr_df[(corr_df["user_id_1"] == random_user) & (corr_df["corr"] >= 0.65)][
-    ["user_id_2", "corr"]].reset_index(drop=True)
+top_users = corr_df[corr_df["corr"] >= 0.65].sort_values(by='corr', ascending=False)
 
-top_users = top_users.sort_values(by='corr', ascending=False)
 
-top_users.rename(columns={"user_id_2": "userId"}, inplace=True)
-
-
-rating = pd.read_csv('datasets/movie_lens_dataset/rating.csv')
+rating = load_ratings()
 top_users_ratings = top_users.merge(rating[["userId", "movieId", "rating"]], how='inner')
 
 top_users_ratings = top_users_ratings[top_users_ratings["userId"] != random_user]
@@ -125,7 +117,7 @@ recommendation_df[recommendation_df["weighted_rating"] > 3.5]
 
 movies_to_be_recommend = recommendation_df[recommendation_df["weighted_rating"] > 3.5].sort_values("weighted_rating", ascending=False)
 
-movie = pd.read_csv('datasets/movie_lens_dataset/movie.csv')
+movie = load_movies()
 movies_to_be_recommend.merge(movie[["movieId", "title"]])
 
 
@@ -134,61 +126,72 @@ movies_to_be_recommend.merge(movie[["movieId", "title"]])
 # Step 6: Functionalization of the Work
 #############################################
 
-def create_user_movie_df():
-    import pandas as pd
-    movie = pd.read_csv('datasets/movie_lens_dataset/movie.csv')
-    rating = pd.read_csv('datasets/movie_lens_dataset/rating.csv')
-    df = movie.merge(rating, how="left", on="movieId")
-    comment_counts = pd.DataFrame(df["title"].value_counts())
-    rare_movies = comment_counts[comment_counts["title"] <= 1000].index
-    common_movies = df[~df["title"].isin(rare_movies)]
-    user_movie_df = common_movies.pivot_table(index=["userId"], columns=["title"], values="rating")
-    return user_movie_df
-
-user_movie_df = create_user_movie_df()
-
 # perc = len(movies_watched) * 60 / 100
 # users_same_movies = user_movie_count[user_movie_count["movie_count"] > perc]["userId"]
 
 
-def user_based_recommender(random_user, user_movie_df, ratio=60, cor_th=0.65, score=3.5):
-    import pandas as pd
-    random_user_df = user_movie_df[user_movie_df.index == random_user]
-    movies_watched = random_user_df.columns[random_user_df.notna().any()].tolist()
-    movies_watched_df = user_movie_df[movies_watched]
-    user_movie_count = movies_watched_df.T.notnull().sum()
-    user_movie_count = user_movie_count.reset_index()
-    user_movie_count.columns = ["userId", "movie_count"]
-    perc = len(movies_watched) * ratio / 100
-    users_same_movies = user_movie_count[user_movie_count["movie_count"] > perc]["userId"]
-
-    final_df = pd.concat([movies_watched_df[movies_watched_df.index.isin(users_same_movies)],
-                          random_user_df[movies_watched]])
-
-    corr_df = final_df.T.corr().unstack().sort_values().drop_duplicates()
-    corr_df = pd.DataFrame(corr_df, columns=["corr"])
-    corr_df.index.names = ['user_id_1', 'user_id_2']
-    corr_df = corr_df.reset_index()
-
-    top_users = corr_df[(corr_df["user_id_1"] == random_user) & (corr_df["corr"] >= cor_th)][
-        ["user_id_2", "corr"]].reset_index(drop=True)
-
-    top_users = top_users.sort_values(by='corr', ascending=False)
-    top_users.rename(columns={"user_id_2": "userId"}, inplace=True)
-    rating = pd.read_csv('datasets/movie_lens_dataset/rating.csv')
-    top_users_ratings = top_users.merge(rating[["userId", "movieId", "rating"]], how='inner')
-    top_users_ratings['weighted_rating'] = top_users_ratings['corr'] * top_users_ratings['rating']
-
-    recommendation_df = top_users_ratings.groupby('movieId').agg({"weighted_rating": "mean"})
-    recommendation_df = recommendation_df.reset_index()
-
-    movies_to_be_recommend = recommendation_df[recommendation_df["weighted_rating"] > score].sort_values("weighted_rating", ascending=False)
-    movie = pd.read_csv('datasets/movie_lens_dataset/movie.csv')
-    return movies_to_be_recommend.merge(movie[["movieId", "title"]])
-
-
-
-random_user = int(pd.Series(user_movie_df.index).sample(1).values)
-user_based_recommender(random_user, user_movie_df, cor_th=0.70, score=4)
-
-
+# ratings, movies and the user x movie matrix are loaded once into memory and
+# reused by every request instead of re-reading rating.csv and movie.csv
+from user_session import UserBasedSession
+session = UserBasedSession.load()
+
+
+def user_based_recommender(random_user, session, ratio=60, cor_th=0.65, score=3.5):
+    # Correlates only the user against the users who watched more than
+    # ratio % of the same movies, then scores the movies they rated
+    return session.recommend(random_user, ratio=ratio, cor_th=cor_th, score=score)
+
+
+random_user = int(pd.Series(session.user_movie_matrix.user_ids).sample(1).values[0])
+user_based_recommender(random_user, session, cor_th=0.70, score=4)
+
+# Recommendations for many users at once: similar users come from blocked
+# sparse products over the whole user x movie matrix, one row per
+# (userId, movie) in the result
+some_users = pd.Series(session.user_movie_matrix.user_ids).sample(100, random_state=1).values
+session.recommend_batch(some_users, cor_th=0.70, score=4)
+
+# A precomputed top-k similar-users index skips the correlation stage of every
+# request; new rows of the ratings feed only refresh the users they affect.
+# It is built offline for every user: python batch_runner.py neighbors
+from user_neighbors import UserNeighborIndex
+session.neighbor_index = UserNeighborIndex.load("models/user_neighbors")
+user_based_recommender(random_user, session, cor_th=0.70, score=4)
+
+# ratings, the user x movie matrix and the attached index are updated together
+new_ratings = rating.sample(100, random_state=1).assign(rating=5.0)
+session.update_ratings(new_ratings)
+
+# Matrix factorization alternative: implicit ALS on all ratings. Serving a
+# user is one dot product with the item factors instead of the neighbour
+# search (python benchmark_als.py compares latency and memory)
+from als_model import ImplicitALS
+als = ImplicitALS(factors=64, iterations=15).fit(session.ratings)
+user_pos = session.user_index.get_loc(random_user)
+rated = session.ratings[user_pos].indices
+movie_pos, als_scores = als.recommend(user_pos, k=10, exclude=rated)
+pd.DataFrame({"movieId": session.movie_ids[movie_pos], "score": als_scores,
+              "title": session.titles[movie_pos]})
+
+# Serving many users from the factors: norm-sorted float32 item blocks, one
+# GEMM per block for the whole batch, rated movies masked through the sparse
+# rating rows
+from mips_index import FactorIndex
+factor_index = FactorIndex(als.item_factors)
+user_rows = session.user_index.get_indexer(some_users)
+movie_pos, als_scores = factor_index.query(als.user_factors[user_rows], k=10, exclude=session.ratings[user_rows])
+
+# Repeated requests are answered from the in-process result cache (LRU, 10 min
+# TTL), keyed by user, ratio, cor_th, score and the version of the session.
+# update_ratings, index updates and attaching an index drop the cached user
+# results.
+from result_cache import RESULT_CACHE, USER
+user_based_recommender = RESULT_CACHE.memoize(USER, models=("session",))(user_based_recommender)
+user_based_recommender(random_user, session, cor_th=0.70, score=4)
+user_based_recommender(random_user, session, cor_th=0.70, score=4)
+session.update_ratings(new_ratings)
+user_based_recommender(random_user, session, cor_th=0.70, score=4)
+RESULT_CACHE.stats()
+#              hits  misses  evictions  expirations  size  hit_rate
+# entry_point
+# user            1       2          0            0     1  0.333333
@@ -0,0 +1,129 @@
+#############################################
+# Precomputed Similar-Users Index
+#############################################
+
+# Offline: for every user of the user x movie matrix the k best correlated
+# candidate users (who watched more than ratio % of the user's movies) are
+# computed from sparse co-rating sums, one block of users at a time, and
+# persisted. Online: similar users are an O(k) lookup and cor_th is applied
+# to the stored correlations, so a request skips the correlation stage.
+# Keep k large enough to hold every user above the cor_th you serve.
+# New ratings only refresh the neighbour lists they can affect:
+# 1. Users whose ratings changed get a fresh exact top-k.
+# 2. Users that listed a changed user as a neighbour are recomputed (stale).
+# 3. Every other user only merges the changed users into its list when they
+#    beat its current k-th correlation.
+# The movie columns stay fixed: ratings of movies outside the matrix are
+# ignored until the index is rebuilt from a new RatingsMatrix.
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from model_store import load_arrays, save_arrays
+from ratings_matrix import RatingsMatrix, pearson_from_sums
+from result_cache import RESULT_CACHE, USER
+from similarity_index import TopKIndex, merge_top_k
+from user_similarity import UserCoRatingSums, user_block_top_k
+
+USER_INDEX_KIND = "user-neighbors"
+
+
+class UserNeighborIndex:
+    def __init__(self, ratings, sim_index, ratio=60, block_size=32):
+        # ratings: RatingsMatrix the index was built from, kept for refreshes
+        self.ratings = ratings
+        self.ratio = ratio
+        self.block_size = block_size
+        # writable copies, the index may come from a read-only memory map
+        self.neighbors = np.array(sim_index.neighbors)
+        self.scores = np.array(sim_index.scores)
+        self._co_sums = None
+
+    @classmethod
+    def build(cls, ratings, k=200, ratio=60, block_size=32):
+        k = min(k, ratings.shape[0] - 1)
+        empty = TopKIndex(np.full((ratings.shape[0], k), -1, dtype=np.int32),
+                          np.zeros((ratings.shape[0], k), dtype=np.float32))
+        index = cls(ratings, empty, ratio, block_size)
+        index._recompute(np.arange(ratings.shape[0]))
+        return index
+
+    @property
+    def sim_index(self):
+        return TopKIndex(self.neighbors, self.scores)
+
+    @property
+    def co_sums(self):
+        if self._co_sums is None:
+            self._co_sums = UserCoRatingSums.from_ratings(self.ratings.matrix)
+        return self._co_sums
+
+    def _recompute(self, positions):
+        n_watched = np.diff(self.ratings.matrix.indptr)
+        k = self.neighbors.shape[1]
+        for start in range(0, len(positions), self.block_size):
+            rows = positions[start:start + self.block_size]
+            self.neighbors[rows], self.scores[rows] = \
+                user_block_top_k(self.co_sums, rows, n_watched, k, self.ratio)
+
+    def similar_users(self, user_id, cor_th=0.65):
+        # Same frame as user_similarity.similar_users, limited to the top k
+        neighbors, scores = self.sim_index.query(self.ratings.user_pos(user_id))
+        keep = scores >= cor_th
+        return pd.DataFrame({"userId": self.ratings.user_ids[neighbors[keep]],
+                             "corr": scores[keep].astype(np.float64)})
+
+    def update(self, rating, movie):
+        # rating: new rows of the ratings feed (userId, movieId, rating);
+        # returns the positions of the users whose ratings changed. An index
+        # attached to a UserBasedSession is updated through
+        # session.update_ratings, so the session's ratings follow.
+        df = rating[["userId", "movieId", "rating"]].merge(movie[["movieId", "title"]], on="movieId")
+        self.ratings, changed = self.ratings.with_ratings(df["userId"], df["title"], df["rating"])
+        if not len(changed):
+            return changed
+        self._co_sums = None
+
+        n_added = self.ratings.shape[0] - self.neighbors.shape[0]
+        if n_added:
+            k = self.neighbors.shape[1]
+            self.neighbors = np.vstack([self.neighbors, np.full((n_added, k), -1, dtype=np.int32)])
+            self.scores = np.vstack([self.scores, np.zeros((n_added, k), dtype=np.float32)])
+
+        stale = np.flatnonzero(np.isin(self.neighbors, changed).any(axis=1))
+        recompute = np.union1d(changed, stale)
+        self._recompute(recompute)
+        self._merge_changed(changed, np.setdiff1d(np.arange(self.ratings.shape[0]), recompute))
+        RESULT_CACHE.invalidate(USER)
+        return changed
+
+    def _merge_changed(self, changed, others):
+        # Users left untouched only need the changed users merged in: their
+        # own ratings (and so their candidate threshold) did not change
+        n_watched = np.diff(self.ratings.matrix.indptr)
+        for start in range(0, len(changed), self.block_size):
+            rows = changed[start:start + self.block_size]
+            sums = self.co_sums.block(rows)
+            corr = pearson_from_sums(**sums)
+            # candidates from the other user's side: co-rated more than ratio %
+            # of that user's movies
+            candidate = sums["n"] > n_watched[np.newaxis, :] * self.ratio / 100
+            corr[~candidate | np.isnan(corr)] = -np.inf
+            merge_top_k(self.neighbors, self.scores, others, rows, corr[:, others].T)
+
+    def save(self, path):
+        matrix = self.ratings.matrix
+        save_arrays(path, USER_INDEX_KIND,
+                    {"neighbors": self.neighbors, "scores": self.scores, "user_ids": self.ratings.user_ids,
+                     "data": matrix.data, "indices": matrix.indices, "indptr": matrix.indptr},
+                    {"titles": self.ratings.titles.tolist(), "ratio": self.ratio,
+                     "block_size": self.block_size})
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        arrays, meta = load_arrays(path, USER_INDEX_KIND, mmap=mmap)
+        shape = (len(arrays["user_ids"]), len(meta["titles"]))
+        matrix = (arrays["data"], arrays["indices"], arrays["indptr"])
+        ratings = RatingsMatrix(sp.csr_matrix(matrix, shape=shape), arrays["user_ids"], meta["titles"])
+        return cls(ratings, TopKIndex(arrays["neighbors"], arrays["scores"]), meta["ratio"],
+                   meta["block_size"])
@@ -0,0 +1,153 @@
+#############################################
+# User-Based Recommender Session
+#############################################
+
+# Loads movie.csv and rating.csv once and keeps:
+# - user_movie_matrix: the common-movies RatingsMatrix used to find similar users
+# - ratings: every rating as a CSR matrix by user (all movies), used to score
+#   the neighbours' movies
+# - titles: movieId -> title
+# so each recommendation is pure in-memory sparse work instead of CSV parsing.
+# With a UserNeighborIndex attached (neighbor_index) recommend looks the
+# similar users up instead of correlating, when it was built with the same ratio.
+# New rows of the ratings feed go through update_ratings, which keeps ratings,
+# user_movie_matrix and the attached index in step.
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from data_loader import MOVIE_PATH, RATING_PATH, load_movies, load_ratings
+from ratings_matrix import RatingsMatrix, build_ratings_matrix
+from result_cache import RESULT_CACHE, USER
+from user_similarity import UserCoRatingSums, similar_users, similar_users_batch
+
+
+class UserBasedSession:
+    def __init__(self, user_movie_matrix, ratings, user_ids, movie_ids, titles, neighbor_index=None,
+                 present=None):
+        self.user_movie_matrix = user_movie_matrix
+        self._neighbor_index = neighbor_index
+        self.ratings = sp.csr_matrix(ratings)
+        self.user_index = pd.Index(user_ids)
+        self.movie_ids = np.asarray(movie_ids)
+        self.titles = np.asarray(titles, dtype=object)
+        self._present = present
+        # user_movie_matrix row -> ratings row
+        self._rating_rows = self.user_index.get_indexer(user_movie_matrix.user_ids)
+        self._co_sums = None
+
+    @classmethod
+    def from_frames(cls, movie, rating, min_count=1000):
+        user_movie_matrix = build_ratings_matrix(movie, rating, min_count)
+        user_codes, user_ids = pd.factorize(rating["userId"], sort=True)
+        movie_codes, movie_ids = pd.factorize(rating["movieId"], sort=True)
+        ratings = sp.csr_matrix((rating["rating"].to_numpy(np.float32), (user_codes, movie_codes)),
+                                shape=(len(user_ids), len(movie_ids)))
+        titles = movie.set_index("movieId")["title"].reindex(movie_ids).to_numpy()
+        return cls(user_movie_matrix, ratings, user_ids, movie_ids, titles)
+
+    @classmethod
+    def load(cls, movie_path=MOVIE_PATH, rating_path=RATING_PATH, min_count=1000):
+        return cls.from_frames(load_movies(movie_path), load_ratings(rating_path), min_count)
+
+    @property
+    def neighbor_index(self):
+        return self._neighbor_index
+
+    @neighbor_index.setter
+    def neighbor_index(self, neighbor_index):
+        # recommend answers from the index from now on
+        self._neighbor_index = neighbor_index
+        RESULT_CACHE.invalidate(USER)
+
+    @property
+    def present(self):
+        # rated-or-not, sharing the index arrays of ratings; built on first use
+        if self._present is None:
+            self._present = sp.csr_matrix((np.ones_like(self.ratings.data), self.ratings.indices,
+                                           self.ratings.indptr), shape=self.ratings.shape)
+        return self._present
+
+    @property
+    def co_sums(self):
+        # co-rating sums for recommend_batch, built on first use
+        if self._co_sums is None:
+            self._co_sums = UserCoRatingSums.from_ratings(self.user_movie_matrix.matrix)
+        return self._co_sums
+
+    def update_ratings(self, rating):
+        # rating: new rows of the ratings feed (userId, movieId, rating). The
+        # last rating of a (user, movie) pair wins, new users are appended and
+        # movies unknown to the session are ignored. Returns the positions of
+        # the changed users in user_movie_matrix.
+        rating = rating[["userId", "movieId", "rating"]]
+        all_ratings, _ = RatingsMatrix(self.ratings, self.user_index, self.movie_ids) \
+            .with_ratings(rating["userId"], rating["movieId"], rating["rating"])
+        self.ratings, self.user_index = all_ratings.matrix, all_ratings.user_index
+        if self.neighbor_index is not None:
+            movie = pd.DataFrame({"movieId": self.movie_ids, "title": self.titles})
+            changed = self.neighbor_index.update(rating, movie)
+            self.user_movie_matrix = self.neighbor_index.ratings
+        else:
+            titles = pd.Series(self.titles, index=self.movie_ids).reindex(rating["movieId"])
+            self.user_movie_matrix, changed = self.user_movie_matrix.with_ratings(
+                rating["userId"], titles, rating["rating"])
+        self._rating_rows = self.user_index.get_indexer(self.user_movie_matrix.user_ids)
+        self._present = None
+        self._co_sums = None
+        RESULT_CACHE.invalidate(USER)
+        return changed
+
+    def recommend(self, user_id, ratio=60, cor_th=0.65, score=3.5):
+        if self.neighbor_index is not None and self.neighbor_index.ratio == ratio:
+            top_users = self.neighbor_index.similar_users(user_id, cor_th=cor_th)
+        else:
+            top_users = similar_users(self.user_movie_matrix, user_id, ratio=ratio, cor_th=cor_th)
+        rows = self.user_index.get_indexer(top_users["userId"])
+        if (rows < 0).any():
+            # e.g. an index updated on its own instead of through update_ratings
+            raise KeyError(f"similar users {top_users['userId'][rows < 0].tolist()} "
+                           "are missing from the session ratings")
+        neighbours = self.ratings[rows]
+        # mean of corr * rating over the neighbours who rated each movie
+        weighted = np.asarray(neighbours.T @ top_users["corr"].to_numpy()).ravel()
+        counts = np.diff(neighbours.tocsc().indptr)
+        rated = np.flatnonzero(counts)
+        weighted_rating = weighted[rated] / counts[rated]
+
+        keep = weighted_rating > score
+        movies_to_be_recommend = pd.DataFrame({"movieId": self.movie_ids[rated[keep]],
+                                               "weighted_rating": weighted_rating[keep],
+                                               "title": self.titles[rated[keep]]})
+        return movies_to_be_recommend.sort_values("weighted_rating", ascending=False).reset_index(drop=True)
+
+    def recommend_batch(self, user_ids, ratio=60, cor_th=0.65, score=3.5, block_size=32):
+        # Long format: one row per (userId, recommended movie), best first per user
+        user_ids = np.asarray(user_ids)
+        positions = self.user_movie_matrix.user_index.get_indexer(user_ids)
+        if (positions < 0).any():
+            raise KeyError(user_ids[positions < 0].tolist())
+
+        frames = []
+        for rows, corr in similar_users_batch(self.user_movie_matrix, positions, ratio=ratio,
+                                              cor_th=cor_th, block_size=block_size,
+                                              co_sums=self.co_sums):
+            corr = sp.csr_matrix((corr.data, self._rating_rows[corr.indices], corr.indptr),
+                                 shape=(len(rows), self.ratings.shape[0]))
+            neighbours = corr.copy()
+            neighbours.data = np.ones_like(neighbours.data)
+            # mean of corr * rating over the neighbours who rated each movie
+            weighted = (corr @ self.ratings).toarray()
+            counts = (neighbours @ self.present).toarray()
+            with np.errstate(divide="ignore", invalid="ignore"):
+                weighted_rating = weighted / counts
+            target, movie = np.nonzero((counts > 0) & (weighted_rating > score))
+            scores = weighted_rating[target, movie]
+            order = np.lexsort((-scores, target))
+            frames.append(pd.DataFrame({"userId": self.user_movie_matrix.user_ids[rows][target[order]],
+                                        "movieId": self.movie_ids[movie[order]],
+                                        "weighted_rating": scores[order],
+                                        "title": self.titles[movie[order]]}))
+        if not frames:
+            return pd.DataFrame(columns=["userId", "movieId", "weighted_rating", "title"])
+        return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,110 @@
+#############################################
+# Vectorized Similar User Search
+#############################################
+
+# Instead of final_df.T.corr() (a full user x user matrix) only the target
+# user's ratings are correlated against the candidate users, over the movies
+# the target user watched, in one vectorized sparse operation.
+# similar_users_batch does the same for a block of target users at once with
+# sparse matrix products.
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from ratings_matrix import centre_ratings, pearson_from_sums, pearson_with
+from similarity_index import pad_top_k, top_k_rows
+
+
+def candidate_users(ratings, user_pos, ratio=60):
+    # Users who watched more than ratio % of the target user's movies
+    watched_pos, watched_ratings = ratings.user_ratings(user_pos)
+    watched = ratings.csc[:, watched_pos].tocsr()
+    movie_count = np.diff(watched.indptr)
+    candidates = np.flatnonzero(movie_count > len(watched_pos) * ratio / 100)
+    candidates = candidates[candidates != user_pos]
+    return candidates, watched, watched_ratings
+
+
+def user_correlations(ratings, user_pos, ratio=60):
+    # (candidate user positions, Pearson correlation with the target user)
+    candidates, watched, watched_ratings = candidate_users(ratings, user_pos, ratio)
+    corr = pearson_with(watched[candidates].T, np.arange(len(watched_ratings)), watched_ratings)
+    return candidates, corr
+
+
+def similar_users(ratings, user_id, ratio=60, cor_th=0.65):
+    candidates, corr = user_correlations(ratings, ratings.user_pos(user_id), ratio)
+    keep = corr >= cor_th
+    top_users = pd.DataFrame({"userId": ratings.user_ids[candidates[keep]], "corr": corr[keep]})
+    return top_users.sort_values(by="corr", ascending=False).reset_index(drop=True)
+
+
+class UserCoRatingSums:
+    # stacked = [X; P; X^2] (CSR) and right = stacked^T, so for target users T
+    # [X_T; P_T; X^2_T] @ right yields, over the movies both rated,
+    # sum_xy = X_T X^T, sum_x = X_T P^T, sum_y = P_T X^T, n = P_T P^T,
+    # sum_xx = X^2_T P^T, sum_yy = P_T (X^2)^T in one sparse product
+    # (X user-centred ratings, P rated-or-not)
+    def __init__(self, stacked, right=None):
+        self.stacked = sp.csr_matrix(stacked)
+        self.right = self.stacked.T.tocsr() if right is None else sp.csr_matrix(right)
+        self.n_users = self.stacked.shape[0] // 3
+
+    @classmethod
+    def from_ratings(cls, matrix):
+        ratings = centre_ratings(matrix, axis=1)
+        present = ratings.copy()
+        present.data = np.ones_like(present.data)
+        squared = ratings.multiply(ratings).tocsr()
+        return cls(sp.vstack((ratings, present, squared), format="csr"))
+
+    def block(self, rows):
+        rows = np.asarray(rows)
+        left = self.stacked[np.concatenate([rows + i * self.n_users for i in range(3)])]
+        sums = (left @ self.right).toarray()
+        users, n_rows = self.n_users, len(rows)
+
+        def part(i, j):
+            return sums[i * n_rows:(i + 1) * n_rows, j * users:(j + 1) * users]
+
+        return {"sum_xy": part(0, 0),
+                "sum_x": part(0, 1),
+                "sum_y": part(1, 0),
+                "n": part(1, 1),
+                "sum_xx": part(2, 1),
+                "sum_yy": part(1, 2)}
+
+
+def candidate_correlations(co_sums, rows, n_watched, ratio=60):
+    # rows x n_users correlations; -inf for users that are not candidates of
+    # the row's user (or have no correlation with it)
+    sums = co_sums.block(rows)
+    corr = pearson_from_sums(**sums)
+    candidate = sums["n"] > n_watched[rows, None] * ratio / 100
+    candidate[np.arange(len(rows)), rows] = False
+    corr[~candidate | np.isnan(corr)] = -np.inf
+    return corr
+
+
+def user_block_top_k(co_sums, rows, n_watched, k=100, ratio=60):
+    # (neighbors, scores) of the users in rows: their k best correlated
+    # candidate users, padded with -1 / 0
+    corr = candidate_correlations(co_sums, rows, n_watched, ratio)
+    top = top_k_rows(corr, k)
+    return pad_top_k(top, np.take_along_axis(corr, top, axis=1))
+
+
+def similar_users_batch(ratings, user_positions, ratio=60, cor_th=0.65, block_size=32, co_sums=None):
+    # Yields (block of target user positions, sparse block x n_users matrix
+    # holding the correlation of every similar user), block_size users at a time.
+    # co_sums can be passed in to reuse it across calls.
+    if co_sums is None:
+        co_sums = UserCoRatingSums.from_ratings(ratings.matrix)
+    n_watched = np.diff(ratings.matrix.indptr)
+    user_positions = np.asarray(user_positions)
+    for start in range(0, len(user_positions), block_size):
+        rows = user_positions[start:start + block_size]
+        corr = candidate_correlations(co_sums, rows, n_watched, ratio)
+        target, neighbour = np.nonzero(corr >= cor_th)
+        yield rows, sp.csr_matrix((corr[target, neighbour], (target, neighbour)),
+                                  shape=(len(rows), ratings.shape[0]))